@@ -34,7 +34,7 @@ async def async_setup_entry(hass: HomeAssistant, config_entry):
     domain_data.setdefault("connections", {})[entry_id] = {
         "wled_ws": None,
         "wled_task": None,
-        "client_ws_list": [],
+        "clients": set(),
     }
     _LOGGER.debug(f"[{entry_id}] async_setup_entry: Initialized connections storage.")
 
@@ -48,9 +48,22 @@ async def async_setup_entry(hass: HomeAssistant, config_entry):
     ])
     _LOGGER.debug(f"[{entry_id}] async_setup_entry: Registered static path for JS file.")
 
-    from .views import WledWSView
+    from .views import WledSnapshotView, WledWSHistoryView, WledWSMuxView, WledWSView, ensure_live_session
     hass.http.register_view(WledWSView)
-    _LOGGER.debug(f"[{entry_id}] async_setup_entry: Registered WledWSView.")
+    hass.http.register_view(WledWSMuxView)
+    hass.http.register_view(WledWSHistoryView)
+    hass.http.register_view(WledSnapshotView)
+    _LOGGER.debug(f"[{entry_id}] async_setup_entry: Registered live view endpoints.")
+
+    # Создаём общее WS-соединение с устройством: его используют и координатор, и live-view прокси
+    from .upstream import WledUpstream
+    wled_ip = (config_entry.options or {}).get("wled_ip", config_data.get("wled_ip"))
+    upstream = WledUpstream(hass, entry_id, wled_ip)
+    domain_data.setdefault("upstream", {})[entry_id] = upstream
+    _LOGGER.debug(f"[{entry_id}] async_setup_entry: Shared upstream connection created.")
+
+    # Если клиенты live-view остались подключены во время перезагрузки записи, возобновляем их сессию
+    ensure_live_session(hass, entry_id)
 
     # Получаем значение опции control (приоритет: config_entry.options > config_entry.data)
     control = (config_entry.options or {}).get("control", config_data.get("control", False))
@@ -59,22 +72,25 @@ async def async_setup_entry(hass: HomeAssistant, config_entry):
     # Сохраняем список загруженных платформ для последующей выгрузки
     loaded_platforms = []
     if control:
-        # Если control == true, создаем координатор с постоянным WS-соединением,
-        # а также подключаем платформы light и sensor
+        # Если control == true, создаем координатор, удерживающий общее WS-соединение постоянно,
+        # а также подключаем платформы light, sensor и camera
         from .coordinator import WLEDDataCoordinator
-        coordinator = WLEDDataCoordinator(hass, config_entry)
-        await coordinator.async_config_entry_first_refresh()
+        coordinator = WLEDDataCoordinator(hass, config_entry, upstream)
+        # Устройство не опрашивается при запуске: данные восстанавливаются из снимка,
+        # первичное обновление выполняется в фоне (см. WLEDDataCoordinator.async_start_background_refresh)
+        await coordinator.async_restore_snapshot()
         domain_data.setdefault("coordinator", {})[entry_id] = coordinator
-        _LOGGER.debug(f"[{entry_id}] async_setup_entry: Coordinator created and refreshed.")
-        # Запускаем WS-соединение в фоне
-        hass.loop.create_task(coordinator.async_start_ws())
-        _LOGGER.debug(f"[{entry_id}] async_setup_entry: Started WS connection task.")
-        await hass.config_entries.async_forward_entry_setups(config_entry, ["sensor", "light"])
-        loaded_platforms = ["sensor", "light"]
+        _LOGGER.debug(f"[{entry_id}] async_setup_entry: Coordinator created (restored: {coordinator.restored}).")
+        # Подписываем координатор на общее WS-соединение
+        await coordinator.async_start_ws()
+        _LOGGER.debug(f"[{entry_id}] async_setup_entry: Coordinator subscribed to upstream connection.")
+        coordinator.async_start_background_refresh()
+        await hass.config_entries.async_forward_entry_setups(config_entry, ["sensor", "light", "camera"])
+        loaded_platforms = ["sensor", "light", "camera"]
     else:
-        # Если control == false, создаем только платформу sensor
-        await hass.config_entries.async_forward_entry_setups(config_entry, ["sensor"])
-        loaded_platforms = ["sensor"]
+        # Если control == false, создаем платформы sensor и camera
+        await hass.config_entries.async_forward_entry_setups(config_entry, ["sensor", "camera"])
+        loaded_platforms = ["sensor", "camera"]
 
         # Если ранее были созданы light-сущности, удаляем их из реестра сущностей.
         from homeassistant.helpers.entity_registry import async_get as async_get_registry
@@ -116,6 +132,20 @@ async def async_unload_entry(hass: HomeAssistant, config_entry):
             await coordinator.async_shutdown()  # Ждем завершения shutdown
             del domain_data["coordinator"][entry_id]
             _LOGGER.debug(f"[{entry_id}] async_unload_entry: Coordinator removed.")
+        # Останавливаем live-сессию, привязанную к старому соединению; клиенты остаются подключёнными
+        live_task = domain_data.get(entry_id, {}).get("connections", {}).get("wled_task")
+        if live_task is not None and not live_task.done():
+            live_task.cancel()
+            _LOGGER.debug(f"[{entry_id}] async_unload_entry: Live view session cancelled.")
+        if "upstream" in domain_data and entry_id in domain_data["upstream"]:
+            upstream = domain_data["upstream"].pop(entry_id)
+            await upstream.async_shutdown()
+            _LOGGER.debug(f"[{entry_id}] async_unload_entry: Upstream connection closed.")
+        if not domain_data.get("upstream"):
+            # Выгружена последняя запись – закрываем общую сессию с пулом соединений
+            from .session import async_close_session
+            await async_close_session(hass)
+            _LOGGER.debug(f"[{entry_id}] async_unload_entry: Pooled client session closed.")
         if "connections" in domain_data and entry_id in domain_data["connections"]:
             del domain_data["connections"][entry_id]
             _LOGGER.debug(f"[{entry_id}] async_unload_entry: Connections removed.")
@@ -134,3 +164,11 @@ async def update_listener(hass, config_entry):
     _LOGGER.debug(f"[{entry_id}] update_listener: Options updated, reloading entry.")
     await hass.config_entries.async_reload(entry_id)
     return
+
+async def async_remove_entry(hass: HomeAssistant, config_entry):
+    """Удаляет сохранённый снимок состояния устройства при удалении записи."""
+    from .snapshot import async_get_snapshot_store
+    store = async_get_snapshot_store(hass)
+    await store.async_load()
+    store.remove(config_entry.entry_id)
+    _LOGGER.debug(f"[{config_entry.entry_id}] async_remove_entry: State snapshot removed.")
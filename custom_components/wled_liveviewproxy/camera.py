@@ -0,0 +1,277 @@
+"""
+camera.py
+
+Камера live-view для мест HA, которые понимают только камеры (picture-glance, уведомления).
+Изображения строятся из кадров того же live-конвейера, что и у карточки: пока открыт MJPEG-поток,
+общий поток камеры (CameraStream) подключён к записи как ещё один клиент live-view.
+
+Каждый кадр кодируется в JPEG не более одного раза (в executor) и разделяется всеми зрителями потока
+и запросами async_camera_image; частота кодирования ограничена опцией camera_fps, ширина изображения –
+опцией camera_width. Pillow необязателен: без него камера отдаёт исходный PNG кадра (frames.encode_png).
+"""
+
+import asyncio
+import io
+import logging
+import time
+from aiohttp import web
+from homeassistant.components.camera import Camera
+from .const import CONF_CAMERA_FPS, CONF_CAMERA_WIDTH, DEFAULT_CAMERA_FPS, DEFAULT_CAMERA_WIDTH, DOMAIN
+from .frames import FORMAT_PNG, encode_png, frame_dimensions, frame_offset
+from .views import async_get_latest_frame, attach_client, detach_client
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow поставляется с HA, но не является зависимостью интеграции
+    Image = None
+
+_LOGGER = logging.getLogger(__name__)
+
+JPEG_QUALITY = 85
+# Лента рисуется полосой с таким соотношением ширины к высоте
+STRIP_ASPECT = 4
+MJPEG_BOUNDARY = "frameboundary"
+
+
+def render_image(data: bytes, max_width: int):
+    """
+    Изображение кадра WLED (выполняется в executor): JPEG шириной max_width или, без Pillow, PNG кадра.
+    Лента растягивается в полосу с интерполяцией (как градиент карточки), матрица – с чёткими пикселями.
+    None для пустого кадра.
+    """
+    width, height, leds = frame_dimensions(data)
+    if not leds:
+        return None
+    if Image is None:
+        return encode_png(data)
+    offset = frame_offset(data)
+    rgb = bytes(data[offset:offset + width * height * 3]).ljust(width * height * 3, b"\0")
+    image = Image.frombytes("RGB", (width, height), rgb)
+    if height == 1:
+        size = (max_width, max(1, max_width // STRIP_ASPECT))
+        resample = Image.Resampling.BILINEAR
+    else:
+        size = (max_width, max(1, round(height * max_width / width)))
+        resample = Image.Resampling.NEAREST if max_width >= width else Image.Resampling.BOX
+    image = image.resize(size, resample)
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=JPEG_QUALITY)
+    return output.getvalue()
+
+
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    async_add_entities([WledLiveCamera(hass, config_entry)])
+
+
+class CameraStream:
+    """
+    Общий MJPEG-поток камеры. Для записи это клиент live-view (см. views.attach_client): он получает кадры
+    в почтовый ящик «последний кадр побеждает», кодирует их не чаще camera_fps и будит зрителей.
+    """
+
+    remote = "camera"
+    frame_format = "mjpeg"
+    max_stops = None
+    visible = True
+
+    def __init__(self, camera: "WledLiveCamera"):
+        self.camera = camera
+        self.entry_id = camera.entry_id
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.viewers = 0
+        # Номер последнего изображения; зрители ждут его изменения
+        self.version = 0
+        self.condition = asyncio.Condition()
+        self._pending = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.closed = False
+
+    @property
+    def max_fps(self):
+        return self.camera.fps
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def offer(self, frame):
+        if self.closed:
+            return
+        if self._pending is not None:
+            self.frames_dropped += 1
+        self._pending = frame
+        self._wakeup.set()
+
+    def heartbeat_expired(self, now: float = None) -> bool:
+        """Поток живёт, пока подключены зрители; heartbeat ему не нужен."""
+        return False
+
+    async def _run(self):
+        while not self.closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            frame, self._pending = self._pending, None
+            if frame is None:
+                continue
+            try:
+                await self.camera.async_render(frame)
+            except Exception as e:
+                _LOGGER.error("[%s] Camera frame rendering failed: %s", self.entry_id, e)
+                continue
+            self.frames_sent += 1
+            self.version += 1
+            async with self.condition:
+                self.condition.notify_all()
+            # Кадры, пришедшие за время паузы, заменяют друг друга в почтовом ящике
+            await asyncio.sleep(1 / self.camera.fps)
+
+    def abort(self, reason: str):
+        if self.closed:
+            return
+        _LOGGER.debug("[%s] Stopping camera stream: %s", self.entry_id, reason)
+        self.closed = True
+        self._wakeup.set()
+
+    async def async_stop(self):
+        self.closed = True
+        self._pending = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Зрители, ожидающие кадр, завершают поток
+        async with self.condition:
+            self.condition.notify_all()
+
+    def as_dict(self) -> dict:
+        """Статистика потока для атрибутов сенсора (в том же виде, что и у LiveViewClient)."""
+        return {
+            "remote": self.remote,
+            "format": self.frame_format,
+            "stops": None,
+            "fps": self.max_fps,
+            "visible": True,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "write_buffer": 0,
+            "heartbeat_age": 0,
+            "viewers": self.viewers,
+        }
+
+
+class WledLiveCamera(Camera):
+    """Камера с изображением live-view устройства WLED."""
+    _attr_has_entity_name = True
+    _attr_name = "Live View"
+
+    def __init__(self, hass, config_entry):
+        super().__init__()
+        self.hass = hass
+        self.entry_id = config_entry.entry_id
+        self._config = config_entry.data
+        self._options = config_entry.options or {}
+        self._attr_unique_id = f"{self.entry_id}_camera"
+        self.content_type = "image/jpeg" if Image is not None else f"image/{FORMAT_PNG}"
+        # Последнее изображение и кадр, из которого оно построено
+        self._image = None
+        self._image_frame = None
+        self._rendered_at = 0.0
+        self._render_lock = asyncio.Lock()
+        self._stream = None
+        if Image is None:
+            _LOGGER.warning("[%s] Pillow is not available, camera serves unscaled PNG frames.", self.entry_id)
+
+    @property
+    def fps(self) -> int:
+        return self._options.get(CONF_CAMERA_FPS, DEFAULT_CAMERA_FPS)
+
+    @property
+    def image_width(self) -> int:
+        return self._options.get(CONF_CAMERA_WIDTH, DEFAULT_CAMERA_WIDTH)
+
+    @property
+    def device_info(self):
+        return {"identifiers": {(DOMAIN, self._config.get("mac", self.entry_id))}}
+
+    @property
+    def is_streaming(self) -> bool:
+        return self._stream is not None
+
+    async def async_render(self, frame):
+        """Изображение кадра; кодируется в executor один раз на кадр, одновременные запросы ждут один результат."""
+        if frame is self._image_frame:
+            return self._image
+        async with self._render_lock:
+            if frame is not self._image_frame:
+                image = await self.hass.async_add_executor_job(render_image, frame.data, self.image_width)
+                if image is not None:
+                    self._image = image
+                    self._image_frame = frame
+                    self._rendered_at = time.monotonic()
+        return self._image
+
+    async def async_camera_image(self, width: int = None, height: int = None):
+        """
+        Текущее изображение. Изображение моложе 1/camera_fps отдаётся без кодирования; без live-сессии
+        кадр захватывается с устройства (см. views.async_get_latest_frame).
+        """
+        if self._image is not None and time.monotonic() - self._rendered_at < 1 / self.fps:
+            return self._image
+        frame = await async_get_latest_frame(self.hass, self.entry_id)
+        if frame is None:
+            return self._image
+        return await self.async_render(frame)
+
+    async def handle_async_mjpeg_stream(self, request: web.Request):
+        """MJPEG-поток: все зрители получают изображения общего потока CameraStream."""
+        response = web.StreamResponse()
+        response.content_type = f"multipart/x-mixed-replace;boundary={MJPEG_BOUNDARY}"
+        await response.prepare(request)
+        stream = self._acquire_stream()
+        try:
+            # Новый зритель сразу получает уже готовое изображение, затем – каждое новое изображение потока
+            seen = stream.version
+            image = self._image
+            while not stream.closed:
+                if image is not None:
+                    await response.write(
+                        f"--{MJPEG_BOUNDARY}\r\nContent-Type: {self.content_type}\r\n"
+                        f"Content-Length: {len(image)}\r\n\r\n".encode() + image + b"\r\n"
+                    )
+                async with stream.condition:
+                    await stream.condition.wait_for(
+                        lambda: stream.closed or (stream.version != seen and self._image is not None)
+                    )
+                seen = stream.version
+                image = self._image
+        finally:
+            await self._release_stream(stream)
+        return response
+
+    def _acquire_stream(self) -> CameraStream:
+        stream = self._stream
+        if stream is None or stream.closed:
+            stream = self._stream = CameraStream(self)
+            attach_client(self.hass, self.entry_id, stream)
+            _LOGGER.debug("[%s] Camera stream started.", self.entry_id)
+        stream.viewers += 1
+        return stream
+
+    async def _release_stream(self, stream: CameraStream):
+        stream.viewers -= 1
+        if stream.viewers > 0:
+            return
+        if self._stream is stream:
+            self._stream = None
+        await detach_client(self.hass, self.entry_id, stream)
+        _LOGGER.debug("[%s] Camera stream stopped.", self.entry_id)
+
+    async def async_will_remove_from_hass(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.abort("camera removed")
+            await stream.async_stop()
@@ -5,6 +5,17 @@ from homeassistant.core import callback
 import asyncio
 import json
 import aiohttp
+from .const import (
+    CONF_CAMERA_FPS,
+    CONF_CAMERA_WIDTH,
+    CONF_LIVE_LINGER,
+    CONF_MAX_FPS,
+    DEFAULT_CAMERA_FPS,
+    DEFAULT_CAMERA_WIDTH,
+    DEFAULT_LIVE_LINGER,
+    DEFAULT_MAX_FPS,
+)
+from .session import async_get_session
 
 DOMAIN = "wled_liveviewproxy"
 
@@ -14,10 +25,15 @@ DATA_SCHEMA = vol.Schema({
     vol.Optional("control", default=False): bool,
 })
 
-# Схема для Options Flow – позволяет менять значение control и wled_ip после создания записи.
+# Схема для Options Flow – позволяет менять значение control, wled_ip, время удержания live-сессии
+# и ограничение частоты live-кадров после создания записи.
 OPTIONS_SCHEMA = vol.Schema({
     vol.Required("wled_ip"): cv.string,
     vol.Required("control", default=False): bool,
+    vol.Required(CONF_LIVE_LINGER, default=DEFAULT_LIVE_LINGER): vol.All(vol.Coerce(int), vol.Range(min=0, max=600)),
+    vol.Required(CONF_MAX_FPS, default=DEFAULT_MAX_FPS): vol.All(vol.Coerce(int), vol.Range(min=0, max=60)),
+    vol.Required(CONF_CAMERA_FPS, default=DEFAULT_CAMERA_FPS): vol.All(vol.Coerce(int), vol.Range(min=1, max=30)),
+    vol.Required(CONF_CAMERA_WIDTH, default=DEFAULT_CAMERA_WIDTH): vol.All(vol.Coerce(int), vol.Range(min=32, max=1920)),
 })
 
 class OptionsFlowHandler(config_entries.OptionsFlow):
@@ -34,6 +50,10 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             initial_options["control"] = self.config_entry.data.get("control", False)
         if "wled_ip" not in initial_options:
             initial_options["wled_ip"] = self.config_entry.data.get("wled_ip")
+        initial_options.setdefault(CONF_LIVE_LINGER, DEFAULT_LIVE_LINGER)
+        initial_options.setdefault(CONF_MAX_FPS, DEFAULT_MAX_FPS)
+        initial_options.setdefault(CONF_CAMERA_FPS, DEFAULT_CAMERA_FPS)
+        initial_options.setdefault(CONF_CAMERA_WIDTH, DEFAULT_CAMERA_WIDTH)
         
         return self.async_show_form(
             step_id="init",
@@ -51,9 +71,11 @@ class WledLiveViewProxyConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             wled_ip = user_input["wled_ip"]
             device_info = {}
             try:
-                async with aiohttp.ClientSession() as session:
-                    ws_url = f"ws://{wled_ip}/ws"
-                    ws = await session.ws_connect(ws_url, timeout=5)
+                # Используем общую сессию интеграции с пулом соединений
+                session = async_get_session(self.hass)
+                ws_url = f"ws://{wled_ip}/ws"
+                # Закрываем только сокет: сессия общая и остаётся в пуле
+                async with session.ws_connect(ws_url, timeout=5) as ws:
                     msg = await ws.receive(timeout=5)
                     if msg.type == aiohttp.WSMsgType.TEXT:
                         try:
@@ -71,7 +93,6 @@ class WledLiveViewProxyConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                             self.hass.components.logger.warning(
                                 DOMAIN, f"Ошибка парсинга JSON: {e}"
                             )
-                    await ws.close()
             except Exception as e:
                 errors["base"] = f"Ошибка подключения к WLED: {str(e)}"
                 return self.async_show_form(
@@ -1,4 +1,18 @@
 # const.py
 # Файл констант для интеграции WLED Proxy
 
-DOMAIN = "wled_liveviewproxy"
\ No newline at end of file
+DOMAIN = "wled_liveviewproxy"
+
+# Сколько секунд live-сессия остаётся активной после отключения последнего клиента
+CONF_LIVE_LINGER = "live_linger"
+DEFAULT_LIVE_LINGER = 30
+
+# Ограничение частоты кадров, принимаемых от WLED (0 – без ограничения)
+CONF_MAX_FPS = "max_fps"
+DEFAULT_MAX_FPS = 0
+
+# Камера: частота кадров MJPEG-потока и ширина изображения (JPEG кодируется не чаще camera_fps)
+CONF_CAMERA_FPS = "camera_fps"
+DEFAULT_CAMERA_FPS = 5
+CONF_CAMERA_WIDTH = "camera_width"
+DEFAULT_CAMERA_WIDTH = 320
@@ -1,309 +1,494 @@
-import asyncio
-import json
-import logging
-import time
-import aiohttp
-import async_timeout
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
-from .const import DOMAIN
-
-_LOGGER = logging.getLogger(__name__)
-
-async def connect_ws_for_coordinator(wled_ip: str, coordinator: "WLEDDataCoordinator"):
-    """
-    Устанавливает постоянное WebSocket-соединение с WLED.
-    Отправляет команду {"v": true} для запроса полного JSON-состояния,
-    затем запускает механизм ping/pong: отправляем "ping" и ожидаем "pong".
-    Если за 15 секунд не получен pong, устройство помечается как недоступное и соединение закрывается.
-    """
-    entry_id = coordinator.entry_id
-    try:
-        _LOGGER.debug("[%s] Creating ClientSession for WLED at ws://%s/ws", entry_id, wled_ip)
-        async with aiohttp.ClientSession() as session:
-            _LOGGER.debug("[%s] Attempting to connect to WLED at ws://%s/ws", entry_id, wled_ip)
-            async with async_timeout.timeout(10):
-                ws = await session.ws_connect(f"ws://{wled_ip}/ws")
-            _LOGGER.debug("[%s] Successfully connected to WLED at ws://%s/ws", entry_id, wled_ip)
-            coordinator.ws = ws
-            coordinator.device_available = True
-            coordinator.async_set_updated_data(coordinator.data)
-            
-            # Если fxdata отсутствует в данных, запрашиваем его сразу после установления соединения.
-            if not coordinator.data or "fxdata" not in coordinator.data:
-                _LOGGER.debug("[%s] fxdata not found in data, fetching effects.", entry_id)
-                await coordinator.async_fetch_effects()
-            
-            _LOGGER.debug("[%s] Sending command {\"v\": true} to request full JSON state.", entry_id)
-            await ws.send_str('{"v": true}')
-            
-            last_pong = time.monotonic()
-            
-            async def ping_loop():
-                nonlocal last_pong
-                while True:
-                    await asyncio.sleep(5)
-                    try:
-                        _LOGGER.debug("[%s] Sending ping to WLED.", entry_id)
-                        await ws.send_str("ping")
-                    except Exception as e:
-                        _LOGGER.error("[%s] Error sending ping: %s", entry_id, e)
-                        break
-                    if time.monotonic() - last_pong > 15:
-                        if coordinator.device_available:
-                            _LOGGER.error("[%s] No pong received within 15 seconds, device unavailable.", entry_id)
-                            coordinator.device_available = False
-                            coordinator.async_set_updated_data(coordinator.data)
-                        else:
-                            _LOGGER.debug("[%s] Continuing without pong, device already unavailable.", entry_id)
-                        await ws.close()
-                        break
-            
-            ping_task = asyncio.create_task(ping_loop())
-            
-            while True:
-                try:
-                    _LOGGER.debug("[%s] Waiting for message from WLED...", entry_id)
-                    async with async_timeout.timeout(10):
-                        msg = await ws.receive()
-                    _LOGGER.debug("[%s] Received message: type=%s, data=%s", entry_id, msg.type, msg.data)
-                except asyncio.TimeoutError:
-                    _LOGGER.debug("[%s] No message received within 10 seconds, continuing to wait.", entry_id)
-                    continue
-                
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    if msg.data.strip().lower() == "pong":
-                        _LOGGER.debug("[%s] Received pong from WLED.", entry_id)
-                        last_pong = time.monotonic()
-                        if not coordinator.device_available:
-                            _LOGGER.info("[%s] Device is available again.", entry_id)
-                            coordinator.device_available = True
-                            coordinator.async_set_updated_data(coordinator.data)
-                        continue
-                    else:
-                        try:
-                            json_data = json.loads(msg.data)
-                            _LOGGER.debug("[%s] Parsed JSON data: %s", entry_id, json_data)
-                            if "state" in json_data:
-                                coordinator.process_new_data(json_data)
-                            elif "success" in json_data:
-                                if coordinator._pending_response_future is not None and not coordinator._pending_response_future.done():
-                                    coordinator._pending_response_future.set_result(json_data)
-                                coordinator.device_available = True
-                                _LOGGER.debug("[%s] Received success response: %s", entry_id, json_data)
-                            else:
-                                coordinator.device_available = True
-                                _LOGGER.debug("[%s] Received response without 'state' or 'success', setting device_available=True", entry_id)
-                        except Exception as e:
-                            _LOGGER.error("[%s] Error parsing JSON: %s", entry_id, e)
-                elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
-                    _LOGGER.debug("[%s] WebSocket closed or encountered error, will reconnect.", entry_id)
-                    break
-                else:
-                    _LOGGER.debug("[%s] Received unrecognized message type: %s", entry_id, msg.type)
-            
-            ping_task.cancel()
-            try:
-                await ping_task
-            except asyncio.CancelledError:
-                pass
-            
-            _LOGGER.debug("[%s] Exiting message loop, closing WebSocket connection.", entry_id)
-            await ws.close()
-    except Exception as err:
-        if coordinator.device_available:
-            _LOGGER.error("[%s] Error connecting to WLED via WebSocket: %s", entry_id, err)
-            coordinator.device_available = False
-            coordinator.async_set_updated_data(coordinator.data)
-        else:
-            _LOGGER.debug("[%s] Error connecting to WLED via WebSocket (device already unavailable): %s", entry_id, err)
-    finally:
-        coordinator.ws = None
-
-class WLEDDataCoordinator(DataUpdateCoordinator):
-    """
-    Координатор для интеграции WLED.
-    Данные обновляются через push (WebSocket) с использованием механизма ping/pong.
-    """
-    def __init__(self, hass, config_entry):
-        super().__init__(hass, _LOGGER, name="WLED Data", update_interval=None)
-        self.config_entry = config_entry
-        self.wled_ip = self.config_entry.options.get("wled_ip", self.config_entry.data.get("wled_ip"))
-        self.data = None
-        self.ws = None
-        self._send_lock = asyncio.Lock()
-        self.device_available = True
-        self._last_ver = None
-        self._last_has_startY = None
-        self._last_device_available = False
-        self._fxdata_lock = asyncio.Lock()
-        self._pending_response_future = None
-        self.entry_id = config_entry.entry_id
-        self._ws_task = None  # Сохраняем задачу цикла WS-соединения
-        _LOGGER.debug("[%s] Initialized with WLED IP: %s", self.entry_id, self.wled_ip)
-
-    async def _async_update_data(self):
-        """
-        Первичное обновление данных интеграции.
-        Если fxdata отсутствует, выполняется запрос списка эффектов.
-        """
-        if not self.data or "fxdata" not in self.data:
-            _LOGGER.debug("[%s] Initial update: fxdata not found, fetching effects.", self.entry_id)
-            new_data = {} if self.data is None else self.data
-            effects_data = await self.async_fetch_effects()
-            new_data["fxdata"] = effects_data.get("fxdata", [])
-            return new_data
-        return self.data
-
-    async def async_start_ws(self):
-        _LOGGER.debug("[%s] Starting WebSocket connection loop.", self.entry_id)
-        # Сохраняем задачу цикла в атрибуте
-        self._ws_task = asyncio.create_task(self._ws_loop())
-        try:
-            await self._ws_task
-        except asyncio.CancelledError:
-            _LOGGER.debug("[%s] WS loop task cancelled.", self.entry_id)
-
-    async def _ws_loop(self):
-        # Этот метод содержит тот же цикл, что был ранее в async_start_ws()
-        while True:
-            _LOGGER.debug("[%s] Connecting to WLED at IP: %s", self.entry_id, self.wled_ip)
-            await connect_ws_for_coordinator(self.wled_ip, self)
-            _LOGGER.debug("[%s] WS connection ended, waiting 10 seconds before reconnecting.", self.entry_id)
-            await asyncio.sleep(10)
-
-    async def send_command(self, command: dict, await_response: bool = True, timeout: float = 5.0) -> dict:
-        response_future = None
-        if await_response:
-            response_future = asyncio.get_event_loop().create_future()
-            self._pending_response_future = response_future
-        async with self._send_lock:
-            if self.ws is not None:
-                try:
-                    _LOGGER.debug("[%s] Sending command: %s", self.entry_id, command)
-                    await self.ws.send_str(json.dumps(command))
-                except Exception as e:
-                    _LOGGER.error("[%s] Error sending command: %s", self.entry_id, e)
-                    if response_future:
-                        response_future.set_exception(e)
-                    return None
-            else:
-                error_msg = "No active WS connection."
-                _LOGGER.error("[%s] %s", self.entry_id, error_msg)
-                if response_future:
-                    response_future.set_exception(Exception(error_msg))
-                return None
-        if response_future:
-            try:
-                response = await asyncio.wait_for(response_future, timeout=timeout)
-                return response
-            except asyncio.TimeoutError:
-                _LOGGER.error("[%s] Timeout waiting for response", self.entry_id)
-                return None
-            finally:
-                self._pending_response_future = None
-        return None
-
-    async def async_fetch_effects(self):
-        """
-        Получает список эффектов и метаданных эффектов с WLED.
-        Выполняет HTTP GET запросы к эндпоинтам /json/eff и /json/fxdata.
-        Если устройство возвращает "0", генерируется исключение.
-        Возвращает словарь с ключом:
-          - 'fxdata': список, где каждый элемент — словарь с ключами "name", "metadata" и "flags".
-        """
-        async with self._fxdata_lock:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    eff_url = f"http://{self.wled_ip}/json/eff"
-                    fxdata_url = f"http://{self.wled_ip}/json/fxdata"
-                    
-                    async with session.get(eff_url) as response_eff:
-                        text_eff = await response_eff.text()
-                    if text_eff.strip() == "0":
-                        raise Exception("Endpoint /json/eff returned 0")
-                    effects = json.loads(text_eff)
-                    
-                    async with session.get(fxdata_url) as response_fx:
-                        text_fx = await response_fx.text()
-                    if text_fx.strip() == "0":
-                        raise Exception("Endpoint /json/fxdata returned 0")
-                    fxdata = json.loads(text_fx)
-                
-                combined = []
-                for i, effect in enumerate(effects):
-                    meta = fxdata[i] if i < len(fxdata) else ""
-                    sections = meta.split(";")
-                    if len(sections) >= 4 and sections[3].strip():
-                        flags = sections[3].strip()
-                    else:
-                        flags = "1"
-                    combined.append({
-                        "name": effect,
-                        "metadata": meta,
-                        "flags": flags,
-                    })
-                
-                _LOGGER.debug("[%s] Combined fxdata: %s", self.entry_id, combined)
-                return {"fxdata": combined}
-            except Exception as err:
-                _LOGGER.error("[%s] Error fetching effects and fxdata: %s", self.entry_id, err)
-                return {"fxdata": self.data.get("fxdata", []) if self.data else []}
-
-    def _has_startY(self, data):
-        segs = data.get("state", {}).get("seg", [])
-        _LOGGER.debug("[%s] Checking segments for startY: %s", self.entry_id, segs)
-        for seg in segs:
-            if "startY" in seg:
-                _LOGGER.debug("[%s] Found startY in segment: %s", self.entry_id, seg)
-                return True
-        _LOGGER.debug("[%s] No segment contains startY.", self.entry_id)
-        return False
-
-    def _should_update_effects(self, new_data):
-        new_ver = new_data.get("info", {}).get("ver")
-        new_has_startY = self._has_startY(new_data)
-        _LOGGER.debug("[%s] Comparing versions: old %s, new %s", self.entry_id, self._last_ver, new_ver)
-        _LOGGER.debug("[%s] Comparing startY presence: old %s, new %s", self.entry_id, self._last_has_startY, new_has_startY)
-        if new_ver != self._last_ver or new_has_startY != self._last_has_startY:
-            self._last_ver = new_ver
-            self._last_has_startY = new_hasStartY = new_has_startY
-            return True
-        return False
-
-    def process_new_data(self, new_data):
-        if not self._last_device_available and self.device_available:
-            _LOGGER.debug("[%s] Device transitioned from unavailable to available; fetching new effects.", self.entry_id)
-            asyncio.create_task(self.async_update_effects(new_data))
-        if self._should_update_effects(new_data):
-            _LOGGER.debug("[%s] Version or segment structure changed; fetching new effects.", self.entry_id)
-            asyncio.create_task(self.async_update_effects(new_data))
-        self._last_device_available = self.device_available
-        if self._pending_response_future is not None and not self._pending_response_future.done():
-            self._pending_response_future.set_result(new_data)
-        self.async_set_updated_data(new_data)
-
-    async def async_update_effects(self, data):
-        effects_data = await self.async_fetch_effects()
-        data["fxdata"] = effects_data.get("fxdata", [])
-        self.async_set_updated_data(data)
-
-    async def async_shutdown(self):
-        _LOGGER.debug("[%s] Shutting down coordinator.", self.entry_id)
-        # Отменяем задачу цикла WS-соединения, если она запущена
-        if self._ws_task is not None:
-            self._ws_task.cancel()
-            try:
-                await self._ws_task
-            except asyncio.CancelledError:
-                _LOGGER.debug("[%s] WS task cancelled successfully.", self.entry_id)
-            self._ws_task = None
-        # Отменяем ожидающий future, если есть
-        if self._pending_response_future is not None and not self._pending_response_future.done():
-            self._pending_response_future.cancel()
-        # Закрываем WS-соединение, если оно открыто
-        if self.ws is not None:
-            try:
-                await self.ws.close()
-            except Exception as e:
-                _LOGGER.error("[%s] Error closing WS during shutdown: %s", self.entry_id, e)
-            self.ws = None
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from .const import DOMAIN
+from .effects import async_get_effect_cache, effects_key
+from .snapshot import async_get_snapshot_store
+from .upstream import EVENT_AVAILABILITY, EVENT_RESPONSE, EVENT_SEND, EVENT_STATE, HOLDER_CONTROL, WledUpstream
+
+_LOGGER = logging.getLogger(__name__)
+
+# Виды ответов WLED: команда с "v": true получает полное состояние, остальные – {"success": true}
+# или, если команда изменила состояние, push-сообщение с состоянием
+REPLY_STATE = "state"
+REPLY_SUCCESS = "success"
+# Сколько ещё хранится запись о команде с истёкшим таймаутом (для резервной записи – с момента отправки):
+# её поздний ответ не должен достаться следующей команде
+LATE_REPLY_GRACE = 5.0
+RTT_SMOOTHING = 0.2
+# Окно объединения команд: не чаще одной отправки за окно, частые изменения (слайдер яркости) сливаются в одну
+COALESCE_WINDOW = 0.2
+# Число записей, одновременно выполняющих фоновое первичное обновление при запуске HA
+STARTUP_CONCURRENCY = 4
+_STARTUP_SEMAPHORE = asyncio.Semaphore(STARTUP_CONCURRENCY)
+
+
+def can_merge_commands(target: dict, command: dict) -> bool:
+    """
+    Можно ли слить command в target одним сообщением. Одиночный сегмент без "id" относится к выбранным
+    сегментам и не выражается вместе с сегментами, заданными по "id" или позиции в списке.
+    """
+    current, update = target.get("seg"), command.get("seg")
+    return current is None or update is None or _selected_segments(current) == _selected_segments(update)
+
+
+def merge_command(target: dict, command: dict) -> dict:
+    """
+    Сливает частичную команду состояния command в target (последнее значение побеждает).
+    Вложенные словари (например, "nl") сливаются по ключам, сегменты "seg" – по "id"; элемент списка
+    без "id" WLED применяет к сегменту с номером его позиции в списке, одиночный сегмент без "id" –
+    к выбранным сегментам. Команды должны быть совместимы (см. can_merge_commands).
+    """
+    for key, value in command.items():
+        if key == "seg":
+            target[key] = _merge_segments(target.get(key), value)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            target[key] = {**target[key], **value}
+        else:
+            target[key] = value
+    return target
+
+
+def _selected_segments(segments) -> bool:
+    return isinstance(segments, dict) and "id" not in segments
+
+
+def _merge_segments(current, update):
+    """Сливает описания сегментов (словарь или список словарей) по "id" или позиции в списке."""
+    if current is None:
+        return update
+    if _selected_segments(current):
+        return {**current, **update}
+    merged = {}
+    for segments in (current, update):
+        for index, seg in enumerate(segments if isinstance(segments, list) else [segments]):
+            if not isinstance(seg, dict):
+                continue
+            seg_id = seg.get("id", index)
+            merged[seg_id] = {**merged.get(seg_id, {"id": seg_id}), **seg}
+    return list(merged.values())
+
+
+class PendingCommand:
+    """
+    Сообщение, ожидающее ответа WLED в очереди in-flight.
+    Резервная запись (future=None) – сообщение, ответа на которое никто не ждёт ({"lv": ...}, {"v": true}
+    общего соединения, команды без ожидания ответа): она только поглощает свой ответ.
+    """
+    __slots__ = ("future", "sent_at", "expired_at", "accepts_state")
+
+    def __init__(self, future=None):
+        self.future = future
+        self.sent_at = time.monotonic()
+        self.expired_at = None if future is not None else self.sent_at
+        # Может ли ответом быть push-сообщение с состоянием (команда, изменяющая состояние)
+        self.accepts_state = False
+
+
+class WLEDDataCoordinator(DataUpdateCoordinator):
+    """
+    Координатор для интеграции WLED.
+    Данные обновляются через push из общего WS-соединения записи (upstream.WledUpstream),
+    доступность устройства определяется механизмом ping/pong этого соединения.
+    """
+    def __init__(self, hass, config_entry, upstream: WledUpstream):
+        super().__init__(hass, _LOGGER, name="WLED Data", update_interval=None)
+        self.config_entry = config_entry
+        self.wled_ip = self.config_entry.options.get("wled_ip", self.config_entry.data.get("wled_ip"))
+        self.data = None
+        self.upstream = upstream
+        self._send_lock = asyncio.Lock()
+        self.device_available = True
+        self._last_ver = None
+        self._last_has_startY = None
+        self._last_device_available = False
+        self._fxdata_lock = asyncio.Lock()
+        # Очереди команд, ожидающих ответа (FIFO): WLED отвечает на команды по одному сокету в порядке получения
+        self._pending = {REPLY_STATE: deque(), REPLY_SUCCESS: deque()}
+        # Отправляемая сейчас команда, ожидающая ответа: (сообщение, запись PendingCommand), см. _handle_send
+        self._outgoing = None
+        self.command_stats = {
+            "sent": 0,
+            "completed": 0,
+            "timeouts": 0,
+            "late_replies": 0,
+            "max_queue_depth": 0,
+            "last_rtt_ms": None,
+            "avg_rtt_ms": None,
+            "queued_commands": 0,
+            "coalesced_payloads": 0,
+        }
+        # Планировщик объединения команд (см. queue_command)
+        self._coalesce_payloads = []
+        self._coalesce_waiters = []
+        self._coalesce_task = None
+        self._last_flush = 0.0
+        self.entry_id = config_entry.entry_id
+        self._unsub_upstream = []  # Функции отписки от общего соединения
+        # Запуск без ожидания устройства: снимок состояния и время до получения живых данных
+        self._setup_started = time.monotonic()
+        self.time_to_ready = None
+        self.restored = False
+        self._refresh_task = None
+        _LOGGER.debug("[%s] Initialized with WLED IP: %s", self.entry_id, self.wled_ip)
+
+    @property
+    def ws(self):
+        """Активное WS-соединение с WLED (общее с live-view прокси) или None."""
+        return self.upstream.ws if self.upstream.connected else None
+
+    async def _async_update_data(self):
+        """
+        Первичное обновление данных интеграции.
+        Если fxdata отсутствует, выполняется запрос списка эффектов.
+        """
+        if not self.data or "fxdata" not in self.data:
+            _LOGGER.debug("[%s] Initial update: fxdata not found, fetching effects.", self.entry_id)
+            new_data = {} if self.data is None else self.data
+            effects_data = await self.async_fetch_effects(new_data)
+            new_data["fxdata"] = effects_data.get("fxdata", [])
+            new_data["effect_index"] = effects_data.get("effect_index", {})
+            return new_data
+        return self.data
+
+    async def async_restore_snapshot(self):
+        """
+        Восстанавливает последнее известное состояние устройства и список эффектов из снимка (snapshot.py).
+        До получения живых данных устройство считается недоступным.
+        """
+        self.device_available = False
+        store = async_get_snapshot_store(self.hass)
+        await store.async_load()
+        snapshot = store.get(self.entry_id)
+        if not snapshot:
+            _LOGGER.debug("[%s] No state snapshot to restore.", self.entry_id)
+            return
+        data = {"state": snapshot.get("state") or {}, "info": snapshot.get("info") or {}}
+        effects = await async_get_effect_cache(self.hass).async_get_cached(snapshot.get("effects_key"))
+        if effects is not None:
+            data["fxdata"] = effects["fxdata"]
+            data["effect_index"] = effects["effect_index"]
+        self.restored = True
+        self.async_set_updated_data(data)
+        _LOGGER.debug("[%s] Restored state snapshot (effects restored: %s).", self.entry_id, effects is not None)
+
+    def async_start_background_refresh(self):
+        """Запускает первичное обновление в фоне; число одновременных обновлений ограничено STARTUP_CONCURRENCY."""
+        self._refresh_task = self.hass.async_create_background_task(
+            self._async_background_refresh(), f"{DOMAIN}_{self.entry_id}_first_refresh"
+        )
+
+    async def _async_background_refresh(self):
+        async with _STARTUP_SEMAPHORE:
+            await self.async_refresh()
+        _LOGGER.debug("[%s] Background first refresh finished in %.2f s.", self.entry_id,
+                      time.monotonic() - self._setup_started)
+
+    def _mark_ready(self):
+        """Фиксирует время от начала настройки записи до получения живых данных устройства."""
+        if self.time_to_ready is not None:
+            return
+        self.time_to_ready = round(time.monotonic() - self._setup_started, 3)
+        _LOGGER.debug("[%s] Ready in %.3f s (restored from snapshot: %s).", self.entry_id,
+                      self.time_to_ready, self.restored)
+
+    async def async_start_ws(self):
+        """Подписывается на общее WS-соединение записи и удерживает его открытым."""
+        if self._unsub_upstream:
+            return
+        _LOGGER.debug("[%s] Subscribing to shared upstream connection.", self.entry_id)
+        self._unsub_upstream = [
+            self.upstream.add_listener(EVENT_STATE, self.process_new_data),
+            self.upstream.add_listener(EVENT_RESPONSE, self._handle_response),
+            self.upstream.add_listener(EVENT_AVAILABILITY, self._handle_availability),
+            self.upstream.add_listener(EVENT_SEND, self._handle_send),
+        ]
+        # Соединение могло быть открыто раньше (live-view): берём его текущую доступность
+        if self.upstream.available is not None:
+            self._handle_availability(self.upstream.available)
+        self.upstream.acquire(HOLDER_CONTROL)
+
+    def _handle_response(self, json_data):
+        """Ответ WLED без ключа "state" (например, {"success": true})."""
+        if isinstance(json_data, dict) and "success" in json_data:
+            self._resolve_pending(json_data)
+            _LOGGER.debug("[%s] Received success response: %s", self.entry_id, json_data)
+        else:
+            _LOGGER.debug("[%s] Received response without 'state' or 'success', setting device_available=True", self.entry_id)
+        self.device_available = True
+
+    def _handle_availability(self, available: bool):
+        """Изменение доступности общего соединения (подключение, ошибка, отсутствие pong)."""
+        if self.device_available == available:
+            return
+        self.device_available = available
+        self.async_set_updated_data(self.data)
+
+    @property
+    def queue_depth(self) -> int:
+        """Число команд, ожидающих ответа (без записей с истёкшим таймаутом)."""
+        return sum(1 for queue in self._pending.values() for pending in queue if pending.expired_at is None)
+
+    def _handle_send(self, data: str):
+        """
+        Вызывается общим соединением перед отправкой каждого сообщения (в порядке отправки).
+        Каждое JSON-сообщение занимает место в очереди ответов: ответ на {"lv": ...} прокси или на команду
+        без ожидания ответа не должен достаться другой команде. Ping (не JSON) ответа в очереди не ждёт.
+        """
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        kind = REPLY_STATE if message.get("v") else REPLY_SUCCESS
+        if self._outgoing is not None and self._outgoing[0] == data:
+            pending = self._outgoing[1]
+            pending.sent_at = time.monotonic()
+            self._outgoing = None
+        else:
+            pending = PendingCommand()
+        pending.accepts_state = any(key != "lv" for key in message)
+        self._pending[kind].append(pending)
+
+    def _discard_pending(self, pending: PendingCommand):
+        for queue in self._pending.values():
+            if pending in queue:
+                queue.remove(pending)
+
+    def _resolve_pending(self, response, state_push: bool = False):
+        """
+        Передаёт ответ самому старому сообщению, ожидающему ответ (WLED отвечает в порядке получения).
+        Ответ {"success": ...} достаётся записи вида REPLY_SUCCESS. Push-сообщение с состоянием достаётся
+        самой старой записи любого вида, если это запрос {"v": true} или команда, изменяющая состояние;
+        иначе push считается посторонним (изменение с другого клиента) и никому не передаётся.
+        Резервные записи и записи с истёкшим таймаутом поглощают свой ответ, пока не истёк LATE_REPLY_GRACE,
+        чтобы он не достался следующей команде; более старые записи отбрасываются.
+        """
+        now = time.monotonic()
+        while True:
+            queues = [
+                queue for kind, queue in self._pending.items() if queue and (state_push or kind == REPLY_SUCCESS)
+            ]
+            if not queues:
+                return
+            queue = min(queues, key=lambda q: q[0].sent_at)
+            pending = queue[0]
+            if pending.expired_at is not None and now - pending.expired_at > LATE_REPLY_GRACE:
+                queue.popleft()
+                continue
+            if state_push and queue is self._pending[REPLY_SUCCESS] and not pending.accepts_state:
+                return
+            queue.popleft()
+            if pending.future is None:
+                _LOGGER.debug("[%s] Reply to unawaited message consumed.", self.entry_id)
+                return
+            if pending.expired_at is not None or pending.future.done():
+                self.command_stats["late_replies"] += 1
+                _LOGGER.debug("[%s] Late reply consumed by timed out command.", self.entry_id)
+                return
+            rtt_ms = round((now - pending.sent_at) * 1000, 1)
+            stats = self.command_stats
+            stats["completed"] += 1
+            stats["last_rtt_ms"] = rtt_ms
+            stats["avg_rtt_ms"] = rtt_ms if stats["avg_rtt_ms"] is None else round(
+                stats["avg_rtt_ms"] + RTT_SMOOTHING * (rtt_ms - stats["avg_rtt_ms"]), 1
+            )
+            pending.future.set_result(response)
+            return
+
+    async def send_command(self, command: dict, await_response: bool = True, timeout: float = 5.0,
+                           raise_errors: bool = False) -> dict:
+        """
+        Отправляет JSON-команду в WLED по общему соединению.
+        Команды не ждут ответов друг друга: каждое сообщение общего соединения ставится в очередь in-flight
+        при отправке (см. _handle_send), и ответы сопоставляются с сообщениями в порядке отправки (см. _resolve_pending).
+        Возвращает ответ WLED или None (ошибка отправки, нет соединения, истёк таймаут);
+        при raise_errors=True ошибки не подавляются: ConnectionError и asyncio.TimeoutError.
+        """
+        pending = None
+        message = json.dumps(command)
+        async with self._send_lock:
+            if not self.upstream.connected:
+                # Не ждём очередной попытки по расписанию: команда – повод переподключиться сразу
+                self.upstream.wake()
+                _LOGGER.error("[%s] No active WS connection.", self.entry_id)
+                if raise_errors:
+                    raise ConnectionError("No active WS connection")
+                return None
+            if await_response:
+                # Запись попадает в очередь в момент отправки (_handle_send), после сообщений, отправленных раньше
+                pending = PendingCommand(asyncio.get_running_loop().create_future())
+                self._outgoing = (message, pending)
+            try:
+                _LOGGER.debug("[%s] Sending command: %s", self.entry_id, command)
+                await self.upstream.send_str(message)
+                self.command_stats["sent"] += 1
+                self.command_stats["max_queue_depth"] = max(self.command_stats["max_queue_depth"], self.queue_depth)
+            except Exception as e:
+                _LOGGER.error("[%s] Error sending command: %s", self.entry_id, e)
+                if pending is not None:
+                    self._discard_pending(pending)
+                if raise_errors:
+                    raise ConnectionError(f"Error sending command: {e}") from e
+                return None
+            finally:
+                self._outgoing = None
+        if pending is None:
+            return None
+        try:
+            return await asyncio.wait_for(pending.future, timeout=timeout)
+        except asyncio.TimeoutError:
+            # Запись остаётся в очереди, чтобы поглотить поздний ответ
+            pending.expired_at = time.monotonic()
+            self.command_stats["timeouts"] += 1
+            _LOGGER.error("[%s] Timeout waiting for response", self.entry_id)
+            if raise_errors:
+                raise
+            return None
+
+    def queue_command(self, command: dict, await_response: bool = False):
+        """
+        Ставит частичную команду состояния ("on", "bri", "fx", "seg" ...) в планировщик объединения.
+        Команды, поступившие в пределах окна COALESCE_WINDOW, сливаются в одну (см. merge_command)
+        и отправляются одним сообщением; несовместимая команда (см. can_merge_commands) начинает
+        следующее сообщение того же окна. По умолчанию ответ не ожидается (fire-and-forget);
+        при await_response=True возвращается future с ответом WLED на последнее сообщение окна.
+        """
+        payloads = self._coalesce_payloads
+        if not payloads or not can_merge_commands(payloads[-1], command):
+            payloads.append({})
+        merge_command(payloads[-1], command)
+        self.command_stats["queued_commands"] += 1
+        future = None
+        if await_response:
+            future = self.hass.loop.create_future()
+            self._coalesce_waiters.append(future)
+        if self._coalesce_task is None or self._coalesce_task.done():
+            delay = max(0.0, self._last_flush + COALESCE_WINDOW - time.monotonic())
+            self._coalesce_task = self.hass.async_create_background_task(
+                self._flush_coalesced(delay), f"{DOMAIN}_{self.entry_id}_coalesce"
+            )
+        return future
+
+    async def _flush_coalesced(self, delay: float):
+        """
+        Отправляет накопленные сообщения по истечении окна объединения.
+        Команды, поставленные во время отправки, копятся для следующего окна и отправляются этой же задачей.
+        """
+        while True:
+            await asyncio.sleep(delay)
+            payloads, waiters = self._coalesce_payloads, self._coalesce_waiters
+            self._coalesce_payloads, self._coalesce_waiters = [], []
+            self._last_flush = time.monotonic()
+            if not payloads:
+                return
+            response = None
+            for index, payload in enumerate(payloads):
+                self.command_stats["coalesced_payloads"] += 1
+                last = index == len(payloads) - 1
+                response = await self.send_command(payload, await_response=last and bool(waiters))
+            for future in waiters:
+                if not future.done():
+                    future.set_result(response)
+            delay = max(0.0, self._last_flush + COALESCE_WINDOW - time.monotonic())
+
+    async def async_fetch_effects(self, data: dict = None):
+        """
+        Получает список эффектов и метаданных эффектов с WLED через общий кэш (effects.EffectCache):
+        устройства с одинаковой прошивкой используют один список, /json/eff и /json/fxdata
+        запрашиваются параллельно только при промахе кэша.
+        Возвращает словарь с ключами:
+          - 'fxdata': список, где каждый элемент — словарь с ключами "name", "metadata" и "flags";
+          - 'effect_index': отображение имени эффекта в его индекс.
+        """
+        data = data if data is not None else (self.data or {})
+        async with self._fxdata_lock:
+            try:
+                cache = async_get_effect_cache(self.hass)
+                effects = await cache.async_get(self.wled_ip, data.get("info"), self._has_startY(data))
+                _LOGGER.debug("[%s] Effect list ready: %s effects", self.entry_id, len(effects["fxdata"]))
+                return effects
+            except Exception as err:
+                _LOGGER.error("[%s] Error fetching effects and fxdata: %s", self.entry_id, err)
+                current = self.data or {}
+                return {"fxdata": current.get("fxdata", []), "effect_index": current.get("effect_index", {})}
+
+    def _has_startY(self, data):
+        segs = data.get("state", {}).get("seg", [])
+        _LOGGER.debug("[%s] Checking segments for startY: %s", self.entry_id, segs)
+        for seg in segs:
+            if "startY" in seg:
+                _LOGGER.debug("[%s] Found startY in segment: %s", self.entry_id, seg)
+                return True
+        _LOGGER.debug("[%s] No segment contains startY.", self.entry_id)
+        return False
+
+    def _should_update_effects(self, new_data):
+        new_ver = new_data.get("info", {}).get("ver")
+        new_has_startY = self._has_startY(new_data)
+        _LOGGER.debug("[%s] Comparing versions: old %s, new %s", self.entry_id, self._last_ver, new_ver)
+        _LOGGER.debug("[%s] Comparing startY presence: old %s, new %s", self.entry_id, self._last_has_startY, new_has_startY)
+        if new_ver != self._last_ver or new_has_startY != self._last_has_startY:
+            self._last_ver = new_ver
+            self._last_has_startY = new_has_startY
+            return True
+        return False
+
+    def process_new_data(self, new_data):
+        if not self._last_device_available and self.device_available:
+            _LOGGER.debug("[%s] Device transitioned from unavailable to available; fetching new effects.", self.entry_id)
+            asyncio.create_task(self.async_update_effects(new_data))
+        if self._should_update_effects(new_data):
+            _LOGGER.debug("[%s] Version or segment structure changed; fetching new effects.", self.entry_id)
+            asyncio.create_task(self.async_update_effects(new_data))
+        self._last_device_available = self.device_available
+        # Push-сообщения WLED не содержат список эффектов: переносим его из текущих данных
+        if self.data and isinstance(new_data, dict):
+            for key in ("fxdata", "effect_index"):
+                if key not in new_data and key in self.data:
+                    new_data[key] = self.data[key]
+        self._resolve_pending(new_data, state_push=True)
+        self._mark_ready()
+        self._save_snapshot(new_data)
+        self.async_set_updated_data(new_data)
+
+    def _save_snapshot(self, data: dict):
+        """Обновляет сохраняемый снимок, если сообщение содержит полное состояние и информацию об устройстве."""
+        if not isinstance(data, dict) or "state" not in data or "info" not in data:
+            return
+        async_get_snapshot_store(self.hass).update(
+            self.entry_id, data["state"], data["info"], effects_key(data["info"], self._has_startY(data))
+        )
+
+    async def async_update_effects(self, data):
+        effects_data = await self.async_fetch_effects(data)
+        data["fxdata"] = effects_data.get("fxdata", [])
+        data["effect_index"] = effects_data.get("effect_index", {})
+        self.async_set_updated_data(data)
+
+    async def async_shutdown(self):
+        _LOGGER.debug("[%s] Shutting down coordinator.", self.entry_id)
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        # Отписываемся от общего соединения и освобождаем его
+        for unsub in self._unsub_upstream:
+            unsub()
+        self._unsub_upstream = []
+        self.upstream.release(HOLDER_CONTROL)
+        # Останавливаем планировщик объединения команд
+        if self._coalesce_task is not None and not self._coalesce_task.done():
+            self._coalesce_task.cancel()
+        for future in self._coalesce_waiters:
+            if not future.done():
+                future.cancel()
+        self._coalesce_payloads, self._coalesce_waiters = [], []
+        # Отменяем все команды, ожидающие ответа
+        for queue in self._pending.values():
+            while queue:
+                pending = queue.popleft()
+                if pending.future is not None and not pending.future.done():
+                    pending.future.cancel()
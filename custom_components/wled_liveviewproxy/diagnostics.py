@@ -0,0 +1,65 @@
+"""
+diagnostics.py
+
+Диагностика записи WLED Live View Proxy: конфигурация (без MAC и IP),
+состояние общего WS-соединения, очередь команд координатора, клиенты live-view и статистика пула HTTP-соединений.
+"""
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN
+from .effects import DATA_EFFECT_CACHE
+from .session import async_get_session_stats
+from .views import delta_compression
+
+TO_REDACT = {"mac", "ip", "wled_ip"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, config_entry) -> dict:
+    """Возвращает диагностические данные для записи."""
+    entry_id = config_entry.entry_id
+    domain_data = hass.data.get(DOMAIN, {})
+    upstream = domain_data.get("upstream", {}).get(entry_id)
+    connections = domain_data.get(entry_id, {}).get("connections", {})
+    client_list = connections.get("clients", ())
+
+    coordinator = domain_data.get("coordinator", {}).get(entry_id)
+    commands_info = None
+    startup_info = None
+    if coordinator is not None:
+        commands_info = dict(coordinator.command_stats, queue_depth=coordinator.queue_depth)
+        startup_info = {"restored_from_snapshot": coordinator.restored, "time_to_ready": coordinator.time_to_ready}
+
+    upstream_info = None
+    if upstream is not None:
+        upstream_info = {
+            "connected": upstream.connected,
+            "available": upstream.available,
+            "live": upstream.live,
+            "state_updated_at": upstream.state_store.updated_at,
+            "state_fetches": upstream.state_store.fetch_count,
+            "reconnect": upstream.get_reconnect_stats(),
+        }
+
+    return {
+        "entry": {
+            "data": async_redact_data(dict(config_entry.data), TO_REDACT),
+            "options": async_redact_data(dict(config_entry.options), TO_REDACT),
+        },
+        "upstream": upstream_info,
+        "commands": commands_info,
+        "startup": startup_info,
+        "live_view": {
+            "clients": [async_redact_data(client.as_dict(), {"remote"}) for client in client_list],
+            "stall_recoveries": connections.get("live_restarts", 0),
+            "reaped_clients": connections.get("reaped", 0),
+            "frames_received": connections.get("frames_received", 0),
+            "frames_suppressed": connections.get("frames_suppressed", 0),
+            "frames_throttled": connections.get("frames_throttled", 0),
+            "history_frames": len(connections.get("history", ())),
+            "delta": dict(connections.get("delta_stats", {}),
+                          compression=delta_compression(connections.get("delta_stats"))),
+        },
+        "session": async_get_session_stats(hass),
+        "effect_cache": dict(domain_data[DATA_EFFECT_CACHE].stats) if DATA_EFFECT_CACHE in domain_data else None,
+    }
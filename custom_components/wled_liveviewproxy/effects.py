@@ -0,0 +1,158 @@
+"""
+effects.py
+
+Общий для всех записей кэш списка эффектов WLED (fxdata).
+Список эффектов и их метаданные зависят только от прошивки, поэтому кэш индексируется
+версией и сборкой прошивки (info.ver, info.vid) и признаком 2D; устройства на одной прошивке
+используют одну запись. Кэш сохраняется в хранилище HA и переживает перезапуск.
+
+Эндпоинты /json/eff и /json/fxdata запрашиваются параллельно; одновременные запросы
+одного ключа (например, при старте нескольких устройств) объединяются в один.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+from .session import async_get_session
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.effects"
+SAVE_DELAY = 10
+# Число хранимых прошивок: старые записи вытесняются
+MAX_ENTRIES = 16
+# Таймаут одного запроса к устройству: выключенное устройство не должно задерживать обновление надолго
+FETCH_TIMEOUT = 10
+
+DATA_EFFECT_CACHE = "effect_cache"
+
+
+def effects_key(info: dict, has_2d: bool = False):
+    """Ключ кэша по данным /json/info; None, если версия прошивки неизвестна."""
+    if not info or not info.get("ver"):
+        return None
+    return f"{info.get('ver')}|{info.get('vid', '')}|{'2d' if has_2d else '1d'}"
+
+
+def build_effect_list(effects: list, fxdata: list) -> dict:
+    """
+    Объединяет ответы /json/eff и /json/fxdata.
+    Возвращает словарь:
+      - 'fxdata': список, где каждый элемент — словарь с ключами "name", "metadata" и "flags";
+      - 'effect_index': отображение имени эффекта в его индекс.
+    """
+    combined = []
+    effect_index = {}
+    for i, effect in enumerate(effects):
+        meta = fxdata[i] if i < len(fxdata) else ""
+        sections = meta.split(";")
+        if len(sections) >= 4 and sections[3].strip():
+            flags = sections[3].strip()
+        else:
+            flags = "1"
+        combined.append({
+            "name": effect,
+            "metadata": meta,
+            "flags": flags,
+        })
+        effect_index.setdefault(effect, i)
+    return {"fxdata": combined, "effect_index": effect_index}
+
+
+class EffectCache:
+    """Кэш списков эффектов, общий для всех записей интеграции."""
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._entries = {}
+        self._inflight = {}
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+        self.stats = {"hits": 0, "misses": 0, "shared": 0}
+
+    async def _async_load(self):
+        async with self._load_lock:
+            if self._loaded:
+                return
+            stored = await self._store.async_load()
+            if isinstance(stored, dict):
+                self._entries = stored.get("entries", {})
+            self._loaded = True
+            _LOGGER.debug("Loaded %s cached effect lists.", len(self._entries))
+
+    def _data_to_save(self) -> dict:
+        return {"entries": self._entries}
+
+    async def async_get_cached(self, key):
+        """Список эффектов из кэша по ключу без обращения к устройству (None при промахе)."""
+        await self._async_load()
+        return self._entries.get(key)
+
+    async def async_get(self, wled_ip: str, info: dict = None, has_2d: bool = False) -> dict:
+        """
+        Возвращает список эффектов устройства (см. build_effect_list).
+        Если info не передан, версия прошивки запрашивается через /json/info.
+        При промахе кэша список загружается с устройства; одновременные запросы одного ключа объединяются.
+        """
+        await self._async_load()
+        session = async_get_session(self.hass)
+        if not info or not info.get("ver"):
+            info = await _async_fetch_json(session, f"http://{wled_ip}/json/info")
+        key = effects_key(info, has_2d)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["shared"] += 1
+            return await asyncio.shield(task)
+        self.stats["misses"] += 1
+        task = self.hass.async_create_task(self._async_fetch(session, wled_ip, key))
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _async_fetch(self, session, wled_ip: str, key: str) -> dict:
+        """Загружает /json/eff и /json/fxdata параллельно и сохраняет результат в кэше."""
+        try:
+            effects, fxdata = await asyncio.gather(
+                _async_fetch_json(session, f"http://{wled_ip}/json/eff"),
+                _async_fetch_json(session, f"http://{wled_ip}/json/fxdata"),
+            )
+            entry = build_effect_list(effects, fxdata)
+            _LOGGER.debug("Fetched %s effects for firmware %s from %s.", len(entry["fxdata"]), key, wled_ip)
+            if key is not None:
+                entry["fetched_at"] = time.time()
+                self._entries[key] = entry
+                while len(self._entries) > MAX_ENTRIES:
+                    oldest = min(self._entries, key=lambda k: self._entries[k].get("fetched_at", 0))
+                    self._entries.pop(oldest)
+                self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+            return entry
+        finally:
+            self._inflight.pop(key, None)
+
+
+async def _async_fetch_json(session, url: str):
+    """GET-запрос JSON к WLED; ответ "0" означает, что эндпоинт недоступен."""
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT)) as response:
+        text = await response.text()
+    if text.strip() == "0":
+        raise Exception(f"Endpoint {url} returned 0")
+    return json.loads(text)
+
+
+def async_get_effect_cache(hass: HomeAssistant) -> EffectCache:
+    """Возвращает общий кэш эффектов, создавая его при первом обращении."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    cache = domain_data.get(DATA_EFFECT_CACHE)
+    if cache is None:
+        cache = domain_data[DATA_EFFECT_CACHE] = EffectCache(hass)
+    return cache
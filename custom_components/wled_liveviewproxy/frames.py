@@ -0,0 +1,376 @@
+"""
+frames.py
+
+Кодирование live-кадров WLED.
+Кадр WLED начинается с байта 76 (ASCII 'L'), затем идёт версия формата
+(1 – лента, 2 – матрица с двумя байтами размеров) и далее по 3 байта RGB на светодиод.
+
+Форматы для клиентов: строка цветов (text), исходный кадр (binary), дельта-кадры (delta)
+и PNG-изображение (png) – для 2D-матриц с размерами из заголовка кадра.
+
+Основной потребитель – views.process_binary: строка цветов для CSS-градиента
+собирается из заранее подготовленных фрагментов по таблице (без форматирования
+каждого светодиода), а при наличии NumPy – векторно, одной выборкой из таблицы байт.
+"""
+
+import logging
+import struct
+import time
+import zlib
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен – используется чистый Python
+    np = None
+
+_LOGGER = logging.getLogger(__name__)
+
+FRAME_MAGIC = 76  # ASCII 'L'
+
+# Заранее подготовленные фрагменты "rgb(R," + "G," + "B)" для каждого значения байта.
+_R_FRAGMENTS = tuple("rgb(%d," % i for i in range(256))
+_G_FRAGMENTS = tuple("%d," % i for i in range(256))
+_B_FRAGMENTS = tuple("%d)" % i for i in range(256))
+
+# Ниже этого количества светодиодов накладные расходы NumPy не окупаются.
+NUMPY_MIN_LEDS = 64
+
+
+def frame_offset(data) -> int:
+    """Возвращает смещение начала RGB-данных в кадре WLED."""
+    return 4 if data[1] == 2 else 2
+
+
+def is_matrix_frame(data) -> bool:
+    """True для кадра 2D-матрицы ('L', 2, ширина, высота, RGB...)."""
+    return len(data) >= 4 and data[0] == FRAME_MAGIC and data[1] == 2
+
+
+def frame_dimensions(data):
+    """
+    Размеры кадра (ширина, высота, число светодиодов в данных).
+    Для ленты высота равна 1, для матрицы размеры берутся из заголовка; (0, 0, 0) для чужих данных.
+    """
+    if len(data) < 2 or data[0] != FRAME_MAGIC:
+        return 0, 0, 0
+    offset = frame_offset(data)
+    led_count = max(0, (len(data) - offset) // 3)
+    if is_matrix_frame(data):
+        return data[2], data[3], led_count
+    return led_count, 1, led_count
+
+
+def _build_numpy_table():
+    """
+    Строит таблицу фрагментов для векторного пути.
+    Строки 0..255 – "rgb(R,", 256..511 – "G,", 512..767 – "B),".
+    Каждая строка дополнена нулями до ширины 8 байт, длины хранятся отдельно.
+    """
+    fragments = (
+        [f.encode() for f in _R_FRAGMENTS]
+        + [f.encode() for f in _G_FRAGMENTS]
+        + [(f + ",").encode() for f in _B_FRAGMENTS]
+    )
+    width = max(len(f) for f in fragments)
+    table = np.zeros((len(fragments), width), dtype=np.uint8)
+    lengths = np.empty(len(fragments), dtype=np.intp)
+    for i, fragment in enumerate(fragments):
+        table[i, : len(fragment)] = np.frombuffer(fragment, dtype=np.uint8)
+        lengths[i] = len(fragment)
+    mask = np.arange(width) < lengths[:, None]
+    return table, mask
+
+
+if np is not None:
+    _NP_TABLE, _NP_MASK = _build_numpy_table()
+    _NP_CHANNEL_BASE = np.array([0, 256, 512], dtype=np.intp)
+
+
+def _encode_css_colors_numpy(view) -> str:
+    """Векторный путь: индексы фрагментов → выборка строк таблицы → сжатие по маске."""
+    rgb = np.frombuffer(view, dtype=np.uint8).reshape(-1, 3)
+    index = (rgb + _NP_CHANNEL_BASE).ravel()
+    encoded = _NP_TABLE[index][_NP_MASK[index]]
+    # Последний фрагмент "B)," несёт лишнюю запятую
+    return encoded.tobytes()[:-1].decode("ascii")
+
+
+def _encode_css_colors_python(view) -> str:
+    """Чистый Python: три шаговых среза memoryview (без копирования) и таблица фрагментов."""
+    r_frag, g_frag, b_frag = _R_FRAGMENTS, _G_FRAGMENTS, _B_FRAGMENTS
+    return ",".join([
+        r_frag[r] + g_frag[g] + b_frag[b]
+        for r, g, b in zip(view[0::3], view[1::3], view[2::3])
+    ])
+
+
+def frame_colors(data) -> list:
+    """Цвета кадра списком [[r, g, b], ...] (для JSON-снимка); пустой список для чужих данных."""
+    if len(data) < 2 or data[0] != FRAME_MAGIC:
+        return []
+    offset = frame_offset(data)
+    rgb = data[offset:]
+    return [list(rgb[i:i + 3]) for i in range(0, len(rgb) - len(rgb) % 3, 3)]
+
+
+def encode_css_colors(data) -> str:
+    """
+    Преобразует кадр WLED в список цветов "rgb(r,g,b),..." для CSS-градиента.
+    Результат побайтово совпадает с прежней построчной реализацией:
+    неполная тройка в конце кадра отбрасывается, кадр без 'L' даёт пустую строку.
+    """
+    if data[0] != FRAME_MAGIC:
+        return ""
+    view = memoryview(data)
+    offset = frame_offset(view)
+    led_count = (len(view) - offset) // 3
+    if led_count <= 0:
+        return ""
+    view = view[offset:offset + led_count * 3]
+    if np is not None and led_count >= NUMPY_MIN_LEDS:
+        return _encode_css_colors_numpy(view)
+    return _encode_css_colors_python(view)
+
+
+# Форматы кадров, которые клиент может выбрать при подключении к /api/wled_ws/{entry_id}
+FORMAT_TEXT = "text"      # строка цветов для CSS-градиента (совместимость со старыми карточками)
+FORMAT_BINARY = "binary"  # исходный кадр WLED: 'L', версия, [ширина, высота], RGB...
+FORMAT_DELTA = "delta"    # опорный кадр или только изменившиеся диапазоны светодиодов (см. encode_delta)
+FORMAT_PNG = "png"        # кадр как PNG-изображение ширина × высота (для матриц; лента – изображение N × 1)
+FRAME_FORMATS = (FORMAT_TEXT, FORMAT_BINARY, FORMAT_DELTA, FORMAT_PNG)
+
+
+def encode_binary(data) -> bytes:
+    """Возвращает кадр WLED без изменений (3 байта на светодиод), либо b"" для чужих данных."""
+    if len(data) < 2 or data[0] != FRAME_MAGIC:
+        return b""
+    return bytes(data)
+
+
+# Дельта-формат (?format=delta). Все числа – big-endian.
+#   Опорный кадр: 'D' (68), 0, далее исходный кадр WLED целиком.
+#   Дельта:       'D' (68), 1, u16 число светодиодов, затем диапазоны: u16 начало, u16 длина, RGB × длина.
+# Дельта всегда считается относительно кадра, который этот клиент получил последним.
+DELTA_MAGIC = 68  # ASCII 'D'
+DELTA_KEYFRAME = 0
+DELTA_CHANGES = 1
+# Сравнение ведётся блоками по DELTA_BLOCK светодиодов: заголовок диапазона (4 байта) не дробит картинку на мелочь
+DELTA_BLOCK = 8
+_DELTA_HEADER = struct.Struct(">BBH")
+_DELTA_RANGE = struct.Struct(">HH")
+
+
+def encode_delta_keyframe(data) -> bytes:
+    """Опорный кадр дельта-формата: заголовок 'D', 0 и исходный кадр WLED."""
+    frame = encode_binary(data)
+    if not frame:
+        return b""
+    return bytes((DELTA_MAGIC, DELTA_KEYFRAME)) + frame
+
+
+def _changed_blocks_python(prev, cur, block_bytes: int) -> list:
+    """Номера блоков, в которых payload отличается (побайтное сравнение срезов)."""
+    return [
+        i // block_bytes
+        for i in range(0, len(cur), block_bytes)
+        if prev[i:i + block_bytes] != cur[i:i + block_bytes]
+    ]
+
+
+def _changed_blocks_numpy(prev, cur, block_bytes: int) -> list:
+    """Векторный путь: сравнение массивов и свёртка по блокам."""
+    diff = np.frombuffer(prev, dtype=np.uint8) != np.frombuffer(cur, dtype=np.uint8)
+    pad = -len(diff) % block_bytes
+    if pad:
+        diff = np.concatenate((diff, np.zeros(pad, dtype=bool)))
+    return np.flatnonzero(diff.reshape(-1, block_bytes).any(axis=1)).tolist()
+
+
+def encode_delta(prev_data, data):
+    """
+    Дельта между двумя кадрами WLED: только изменившиеся диапазоны светодиодов.
+    Возвращает None, если дельта невозможна (другой заголовок или длина кадра, больше 65535 светодиодов)
+    или не меньше опорного кадра – тогда клиенту отправляется опорный кадр.
+    """
+    if len(prev_data) != len(data) or len(data) < 2 or data[0] != FRAME_MAGIC:
+        return None
+    offset = frame_offset(data)
+    if prev_data[:offset] != data[:offset]:
+        return None
+    led_count = (len(data) - offset) // 3
+    if led_count <= 0 or led_count > 0xFFFF:
+        return None
+    end = offset + led_count * 3
+    prev = memoryview(prev_data)[offset:end]
+    cur = memoryview(data)[offset:end]
+    block_bytes = DELTA_BLOCK * 3
+    if np is not None and led_count >= NUMPY_MIN_LEDS:
+        blocks = _changed_blocks_numpy(prev, cur, block_bytes)
+    else:
+        blocks = _changed_blocks_python(prev, cur, block_bytes)
+
+    parts = [_DELTA_HEADER.pack(DELTA_MAGIC, DELTA_CHANGES, led_count)]
+    size = _DELTA_HEADER.size
+    limit = len(data) + 2
+    i = 0
+    while i < len(blocks):
+        # Соседние изменившиеся блоки объединяются в один диапазон
+        j = i
+        while j + 1 < len(blocks) and blocks[j + 1] == blocks[j] + 1:
+            j += 1
+        start = blocks[i] * DELTA_BLOCK
+        count = min((blocks[j] + 1) * DELTA_BLOCK, led_count) - start
+        parts.append(_DELTA_RANGE.pack(start, count))
+        parts.append(cur[start * 3:(start + count) * 3])
+        size += _DELTA_RANGE.size + count * 3
+        if size >= limit:
+            return None
+        i = j + 1
+    return b"".join(parts)
+
+
+# Пределы числа цветовых точек, которое клиент может запросить (?stops=N)
+MIN_STOPS = 2
+MAX_STOPS = 4096
+
+
+def resample_frame(data, stops: int):
+    """
+    Уменьшает кадр WLED до stops светодиодов усреднением соседних (ленточный кадр 'L', 1).
+    Возвращает None, если кадр не нуждается в уменьшении, не является кадром WLED
+    или является кадром матрицы (его геометрия сохраняется как есть).
+    """
+    if len(data) < 2 or data[0] != FRAME_MAGIC or is_matrix_frame(data):
+        return None
+    offset = frame_offset(data)
+    led_count = (len(data) - offset) // 3
+    if led_count <= stops:
+        return None
+    view = memoryview(data)[offset:offset + led_count * 3]
+    if np is not None and led_count >= NUMPY_MIN_LEDS:
+        rgb = np.frombuffer(view, dtype=np.uint8).reshape(-1, 3).astype(np.uint32)
+        starts = (np.arange(stops) * led_count) // stops
+        counts = np.diff(np.append(starts, led_count))[:, None]
+        sums = np.add.reduceat(rgb, starts, axis=0)
+        resampled = ((sums + counts // 2) // counts).astype(np.uint8).tobytes()
+    else:
+        # Префиксные суммы каналов: сумма любого отрезка – разность двух значений
+        prefix = [(0, *accumulate(view[channel::3])) for channel in range(3)]
+        bounds = [i * led_count // stops for i in range(stops + 1)]
+        spans = [(start, end, (end - start) // 2, end - start) for start, end in zip(bounds, bounds[1:])]
+        out = bytearray(stops * 3)
+        for channel, sums in enumerate(prefix):
+            out[channel::3] = bytes([(sums[end] - sums[start] + half) // count for start, end, half, count in spans])
+        resampled = bytes(out)
+    return bytes((FRAME_MAGIC, 1)) + resampled
+
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Кадры меняются постоянно: быстрый уровень сжатия важнее последних процентов размера
+PNG_COMPRESSION_LEVEL = 1
+
+
+def _png_chunk(chunk_type: bytes, payload: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(payload)) + chunk_type + payload
+        + struct.pack(">I", zlib.crc32(chunk_type + payload) & 0xFFFFFFFF)
+    )
+
+
+def encode_png(data) -> bytes:
+    """
+    Кадр WLED как PNG (RGB, 8 бит) средствами стандартной библиотеки (zlib).
+    Матрица – изображение ширина × высота из заголовка кадра, лента – изображение N × 1.
+    Недостающие пиксели матрицы заполняются чёрным. Для чужих данных возвращает b"".
+    """
+    width, height, led_count = frame_dimensions(data)
+    if not width or not height or not led_count:
+        return b""
+    offset = frame_offset(data)
+    rgb = bytes(memoryview(data)[offset:offset + led_count * 3])
+    row_bytes = width * 3
+    total = row_bytes * height
+    if len(rgb) < total:
+        rgb += bytes(total - len(rgb))
+    # Каждой строке предшествует байт фильтра 0 (None)
+    raw = b"".join(b"\x00" + rgb[row * row_bytes:(row + 1) * row_bytes] for row in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        _PNG_SIGNATURE
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(raw, PNG_COMPRESSION_LEVEL))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+FRAME_ENCODERS = {
+    FORMAT_TEXT: encode_css_colors,
+    FORMAT_BINARY: encode_binary,
+    FORMAT_PNG: encode_png,
+    # Без базового кадра дельта-формат отдаёт опорный кадр; дельты строит LiveFrame.delta_from
+    FORMAT_DELTA: encode_delta_keyframe,
+}
+
+
+class LiveFrame:
+    """
+    Один кадр live-view от WLED.
+    Каждое представление кадра кодируется не более одного раза и разделяется между
+    всеми клиентами, выбравшими этот формат.
+    """
+
+    __slots__ = ("data", "seq", "received_at", "width", "height", "led_count", "_encoded", "_deltas", "_resampled")
+
+    def __init__(self, data, seq: int = 0):
+        self.data = bytes(data)
+        self.seq = seq
+        self.received_at = time.time()
+        self.width, self.height, self.led_count = frame_dimensions(self.data)
+        self._encoded = {}
+        self._deltas = {}
+        self._resampled = {}
+
+    @property
+    def is_matrix(self) -> bool:
+        return is_matrix_frame(self.data)
+
+    def encode(self, fmt: str):
+        """Возвращает кадр в формате fmt (str для текстового, bytes для остальных)."""
+        try:
+            return self._encoded[fmt]
+        except KeyError:
+            pass
+        encoded = FRAME_ENCODERS[fmt](self.data)
+        self._encoded[fmt] = encoded
+        return encoded
+
+    def delta_from(self, base: "LiveFrame"):
+        """
+        Дельта относительно кадра base (см. encode_delta) или None, если нужен опорный кадр.
+        Результат кэшируется по номеру и размеру base: клиенты, получившие один и тот же кадр, разделяют
+        одну дельту. Уменьшенные кадры (resampled) сохраняют номер исходного и отличаются размером.
+        """
+        key = (base.seq, len(base.data))
+        try:
+            return self._deltas[key]
+        except KeyError:
+            pass
+        delta = encode_delta(base.data, self.data)
+        self._deltas[key] = delta
+        return delta
+
+    def resampled(self, stops: int) -> "LiveFrame":
+        """
+        Кадр, уменьшенный до stops светодиодов (см. resample_frame), или сам кадр, если уменьшать нечего.
+        Создаётся один раз для каждого значения stops и разделяется клиентами с этим значением,
+        вместе со всеми своими закодированными представлениями.
+        """
+        try:
+            return self._resampled[stops]
+        except KeyError:
+            pass
+        data = resample_frame(self.data, stops)
+        frame = self if data is None else LiveFrame(data, self.seq)
+        self._resampled[stops] = frame
+        return frame
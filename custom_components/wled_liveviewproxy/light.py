@@ -5,7 +5,7 @@ light.py
 Состояние устройства (on/off, яркость, эффект) обновляется через push‑обновления,
 поступающие из координатора (DataUpdateCoordinator), который получает данные через WebSocket.
 Команды включения/выключения и изменения яркости отправляются на WLED через основное WS‑соединение,
-управляемое координатором.
+управляемое координатором; частые команды объединяются планировщиком координатора (queue_command).
 Начальные свойства сущности задаются сразу при инициализации на основе данных, полученных координатором.
 """
 
@@ -22,13 +22,13 @@ _LOGGER = logging.getLogger(__name__)
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Настроить платформу света для WLED с использованием координатора.
     
-    Ждёт, пока координатор получит начальные данные, и только затем создаёт сущность.
+    Сущность создаётся сразу: с восстановленным из снимка состоянием (или недоступной),
+    живые данные приходят от координатора после фонового обновления.
     """
     coordinator = hass.data[DOMAIN]["coordinator"][config_entry.entry_id]
-    _LOGGER.debug("[%s] Light: Waiting for coordinator initial refresh...", config_entry.entry_id)
-    await coordinator.async_config_entry_first_refresh()
-    _LOGGER.debug("[%s] Light: Coordinator data received. Adding WLEDLight entity.", config_entry.entry_id)
-    async_add_entities([WLEDLight(coordinator, config_entry)], update_before_add=True)
+    _LOGGER.debug("[%s] Light: Adding WLEDLight entity (coordinator data restored: %s).",
+                  config_entry.entry_id, coordinator.restored)
+    async_add_entities([WLEDLight(coordinator, config_entry)])
 
 class WLEDLight(CoordinatorEntity, LightEntity):
     """Светильник WLED, обновляемый через DataUpdateCoordinator (push‑обновления)."""
@@ -158,9 +158,11 @@ class WLEDLight(CoordinatorEntity, LightEntity):
         if brightness is not None:
             command["bri"] = brightness
         if self.coordinator.ws is not None:
-            await self.coordinator.send_command(command)
-            _LOGGER.debug("[%s] Light: Sent turn on command via main WS: %s", self._entry_id, command)
+            # Частые вызовы (слайдер, автоматизации) объединяются координатором в одну команду на окно
+            self.coordinator.queue_command(command)
+            _LOGGER.debug("[%s] Light: Queued turn on command via main WS: %s", self._entry_id, command)
         else:
+            self.coordinator.upstream.wake()
             _LOGGER.error("[%s] Light: No active WS connection to send command. Command not sent.", self._entry_id)
         self._state = True
         if brightness is not None:
@@ -171,9 +173,10 @@ class WLEDLight(CoordinatorEntity, LightEntity):
         _LOGGER.debug("[%s] Light: Turning off via main WS connection.", self._entry_id)
         command = {"on": False}
         if self.coordinator.ws is not None:
-            await self.coordinator.send_command(command)
-            _LOGGER.debug("[%s] Light: Sent turn off command via main WS: %s", self._entry_id, command)
+            self.coordinator.queue_command(command)
+            _LOGGER.debug("[%s] Light: Queued turn off command via main WS: %s", self._entry_id, command)
         else:
+            self.coordinator.upstream.wake()
             _LOGGER.error("[%s] Light: No active WS connection to send command. Command not sent.", self._entry_id)
         self._state = False
         self.async_write_ha_state()
@@ -0,0 +1,389 @@
+"""
+liveview.py
+
+Клиенты live-view (браузерные WS-соединения к /api/wled_ws/{entry_id}).
+Каждый клиент получает собственную задачу отправки и почтовый ящик на один кадр:
+новый кадр заменяет ещё не отправленный, поэтому медленный клиент не задерживает
+ни остальных зрителей, ни цикл приёма кадров от WLED.
+
+Клиент может ограничить число цветовых точек (?stops=N) и частоту кадров (?fps=N):
+уменьшенный кадр строится один раз на значение stops (LiveFrame.resampled) и разделяется
+клиентами с тем же значением, а между отправками клиент выжидает 1/fps, получая затем самый свежий кадр.
+
+Для дельта-формата клиент помнит последний отправленный ему кадр: следующая дельта
+строится относительно него, поэтому пропущенные в почтовом ящике кадры не ломают картинку.
+
+Карточка сообщает, видна ли она ({"visible": false}); скрытому клиенту кадры не отправляются.
+
+Мультиплексное соединение (/api/wled_ws_mux, MuxConnection) подписано на несколько записей:
+каждая подписка (MuxSubscription) ведёт себя как отдельный клиент записи, но кадры всех подписок
+отправляет один писатель соединения, помечая их идентификатором записи.
+"""
+
+import asyncio
+import logging
+import time
+import async_timeout
+from aiohttp import web
+from .frames import FORMAT_DELTA, MAX_STOPS, MIN_STOPS
+
+_LOGGER = logging.getLogger(__name__)
+
+# Порог заполнения буфера отправки транспорта, после которого клиент считается отстающим (байт)
+CLIENT_BUFFER_LIMIT = 256 * 1024
+# Сколько секунд буфер может непрерывно оставаться выше порога, прежде чем клиент будет отключён
+CLIENT_CONGESTION_TIMEOUT = 5.0
+# Карточка присылает "heartbeat" каждые 30 секунд; клиент без сообщений дольше этого срока считается зависшим
+HEARTBEAT_TIMEOUT = 75
+# Дельта-формат: опорный кадр отправляется не реже чем раз в столько кадров
+DELTA_KEYFRAME_INTERVAL = 100
+# Пределы частоты кадров, которую клиент может запросить (?fps=N)
+MIN_CLIENT_FPS = 1
+MAX_CLIENT_FPS = 60
+
+
+class LiveViewClient:
+    """Подключённый клиент live-view с задачей отправки и почтовым ящиком «последний кадр побеждает»."""
+
+    def __init__(self, ws: web.WebSocketResponse, request: web.Request, entry_id: str, frame_format: str,
+                 delta_stats: dict = None):
+        self.ws = ws
+        self.entry_id = entry_id
+        self.frame_format = frame_format
+        # Ограничения клиента: число цветовых точек и частота кадров (None – без ограничения)
+        self.max_stops = None
+        self.max_fps = None
+        # Дельта-формат: последний отправленный кадр и общие счётчики записи (кадры, байты до и после сжатия)
+        self._delta_base = None
+        self._frames_since_keyframe = 0
+        self._delta_stats = delta_stats if delta_stats is not None else {}
+        self.remote = request.remote
+        self.last_heartbeat = time.time()
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self._transport = request.transport
+        self._pending = None
+        self._wakeup = asyncio.Event()
+        self._writer_task = None
+        self._congested_since = None
+        # Карточка на экране (сообщение {"visible": ...}); скрытому клиенту кадры не отправляются
+        self.visible = True
+        self.closed = False
+
+    def heartbeat(self):
+        """Отмечает, что клиент жив (получено сообщение от клиента)."""
+        self.last_heartbeat = time.time()
+
+    def heartbeat_expired(self, now: float = None) -> bool:
+        """True, если от клиента ничего не приходило дольше HEARTBEAT_TIMEOUT."""
+        return (now if now is not None else time.time()) - self.last_heartbeat > HEARTBEAT_TIMEOUT
+
+    def set_format(self, frame_format: str):
+        """Меняет формат кадров; дельта-формат начнётся с опорного кадра."""
+        self.frame_format = frame_format
+        self._delta_base = None
+
+    def set_limits(self, stops=None, fps=None):
+        """
+        Задаёт ограничения клиента; некорректные значения игнорируются, значения вне пределов обрезаются,
+        0 снимает ограничение (общее соединение карточек меняет ограничения по мере их подключения).
+        Смена числа точек меняет размер кадра, поэтому дельта-формат начнётся с опорного кадра.
+        """
+        stops = _parse_limit(stops, MIN_STOPS, MAX_STOPS, int)
+        if stops is not None and (stops or None) != self.max_stops:
+            self.max_stops = stops or None
+            self._delta_base = None
+        fps = _parse_limit(fps, MIN_CLIENT_FPS, MAX_CLIENT_FPS, float)
+        if fps is not None:
+            self.max_fps = fps or None
+
+    def set_visible(self, visible: bool) -> bool:
+        """Меняет видимость клиента; возвращает True, если она изменилась. Скрытый клиент теряет неотправленный кадр."""
+        visible = bool(visible)
+        if visible == self.visible:
+            return False
+        self.visible = visible
+        if not visible:
+            self._pending = None
+        return True
+
+    def start(self):
+        """Запускает задачу отправки кадров клиенту."""
+        self._writer_task = asyncio.create_task(self._writer())
+
+    def offer(self, frame):
+        """
+        Кладёт кадр в почтовый ящик клиента, не дожидаясь отправки.
+        Если предыдущий кадр ещё не отправлен, он заменяется новым и учитывается как пропущенный.
+        """
+        if self.closed or not self.visible:
+            return
+        if self._is_congested():
+            self.abort("write buffer stayed above %d bytes" % CLIENT_BUFFER_LIMIT)
+            return
+        if self._pending is not None:
+            self.frames_dropped += 1
+        self._pending = frame
+        self._wakeup.set()
+
+    def write_buffer_size(self) -> int:
+        """Текущий объём неотправленных данных в транспорте клиента."""
+        transport = self._transport
+        if transport is None or transport.is_closing():
+            return 0
+        try:
+            return transport.get_write_buffer_size()
+        except Exception:
+            return 0
+
+    def _is_congested(self) -> bool:
+        """True, если буфер клиента непрерывно превышает порог дольше CLIENT_CONGESTION_TIMEOUT."""
+        if self.write_buffer_size() <= CLIENT_BUFFER_LIMIT:
+            self._congested_since = None
+            return False
+        now = time.monotonic()
+        if self._congested_since is None:
+            self._congested_since = now
+            return False
+        return now - self._congested_since > CLIENT_CONGESTION_TIMEOUT
+
+    async def _writer(self):
+        while not self.closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            frame, self._pending = self._pending, None
+            if frame is None:
+                continue
+            data = self.render(frame)
+            if not data:
+                continue
+            try:
+                if isinstance(data, bytes):
+                    await self.ws.send_bytes(data)
+                else:
+                    await self.ws.send_str(data)
+                self.frames_sent += 1
+            except Exception as e:
+                _LOGGER.debug("[%s] Send to client %s failed: %s", self.entry_id, self.remote, e)
+                self.abort("send error")
+                return
+            if self.max_fps:
+                # Кадры, пришедшие за время паузы, заменяют друг друга в почтовом ящике
+                await asyncio.sleep(1 / self.max_fps)
+
+    def render(self, frame):
+        """Представление кадра для клиента: уменьшенное до max_stops и закодированное в его формате."""
+        if self.max_stops:
+            frame = frame.resampled(self.max_stops)
+        if self.frame_format == FORMAT_DELTA:
+            return self._encode_delta(frame)
+        return frame.encode(self.frame_format)
+
+    def _encode_delta(self, frame):
+        """
+        Дельта относительно последнего отправленного клиенту кадра или опорный кадр:
+        для нового клиента, раз в DELTA_KEYFRAME_INTERVAL кадров и когда дельта невыгодна.
+        """
+        data = None
+        base = self._delta_base
+        if base is not None and self._frames_since_keyframe < DELTA_KEYFRAME_INTERVAL:
+            data = frame.delta_from(base)
+        stats = self._delta_stats
+        if data is None:
+            data = frame.encode(FORMAT_DELTA)
+            if not data:
+                return data
+            self._frames_since_keyframe = 0
+            stats["keyframes"] = stats.get("keyframes", 0) + 1
+        else:
+            self._frames_since_keyframe += 1
+        self._delta_base = frame
+        stats["frames"] = stats.get("frames", 0) + 1
+        stats["raw_bytes"] = stats.get("raw_bytes", 0) + len(frame.data)
+        stats["sent_bytes"] = stats.get("sent_bytes", 0) + len(data)
+        return data
+
+    def abort(self, reason: str):
+        """Разрывает соединение с клиентом; основной цикл WledWSView.get завершится и удалит клиента."""
+        if self.closed:
+            return
+        self.closed = True
+        _LOGGER.debug("[%s] Dropping client %s: %s (sent=%s, dropped=%s)",
+                      self.entry_id, self.remote, reason, self.frames_sent, self.frames_dropped)
+        self._wakeup.set()
+        if self._transport is not None and not self._transport.is_closing():
+            self._transport.abort()
+
+    async def async_stop(self):
+        """Останавливает задачу отправки (вызывается при отключении клиента)."""
+        self.closed = True
+        self._pending = None
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+
+    def as_dict(self) -> dict:
+        """Статистика клиента для атрибутов сенсора."""
+        return {
+            "remote": self.remote,
+            "format": self.frame_format,
+            "stops": self.max_stops,
+            "fps": self.max_fps,
+            "visible": self.visible,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "write_buffer": self.write_buffer_size(),
+            "heartbeat_age": round(time.time() - self.last_heartbeat),
+        }
+
+
+def _parse_limit(value, minimum, maximum, cast):
+    """
+    Приводит ограничение клиента к числу в пределах [minimum, maximum]: 0 – без ограничения,
+    None для пустых и некорректных значений.
+    """
+    if value is None or value == "":
+        return None
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        return None
+    if value < 0:
+        return None
+    if value == 0:
+        return 0
+    return max(minimum, min(maximum, value))
+
+
+class MuxSubscription(LiveViewClient):
+    """
+    Подписка мультиплексного соединения на одну запись. Для записи это обычный клиент (формат,
+    ограничения, видимость, почтовый ящик), но собственной задачи отправки у него нет:
+    почтовый ящик будит общего писателя MuxConnection. Heartbeat и буфер отправки общие
+    для соединения, поэтому abort разрывает соединение целиком.
+    """
+
+    def __init__(self, mux, entry_id: str, frame_format: str, delta_stats: dict = None):
+        super().__init__(mux.ws, mux.request, entry_id, frame_format, delta_stats)
+        self._wakeup = mux.wakeup
+        # Префикс кадра: 'M', длина идентификатора записи, идентификатор (UTF-8)
+        tag = entry_id.encode()
+        self.tag = b"M" + bytes((len(tag),)) + tag
+        self.next_send = 0.0
+
+    def start(self):
+        """Кадры подписки отправляет писатель MuxConnection."""
+
+    def take(self):
+        """Забирает кадр из почтового ящика (None, если он пуст)."""
+        frame, self._pending = self._pending, None
+        return frame
+
+    async def async_stop(self):
+        self.closed = True
+        self._pending = None
+
+    def as_dict(self) -> dict:
+        return dict(super().as_dict(), multiplexed=True)
+
+
+class MuxConnection:
+    """
+    Мультиплексное WS-соединение браузера: подписки на несколько записей и один писатель.
+    Кадр подписки отправляется бинарным сообщением 'M', длина идентификатора записи (1 байт),
+    идентификатор, затем кадр в формате подписки (текстовый формат – в UTF-8).
+    Ограничение частоты соблюдается для каждой подписки отдельно.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, request: web.Request):
+        self.ws = ws
+        self.request = request
+        self.remote = request.remote
+        self.subscriptions = {}
+        self.wakeup = asyncio.Event()
+        self._writer_task = None
+        self.closed = False
+
+    def subscribe(self, entry_id: str, frame_format: str, delta_stats: dict = None):
+        """Создаёт подписку на запись; None, если она уже есть или идентификатор не помещается в префикс."""
+        if entry_id in self.subscriptions or not entry_id or len(entry_id.encode()) > 255:
+            return None
+        subscription = self.subscriptions[entry_id] = MuxSubscription(self, entry_id, frame_format, delta_stats)
+        return subscription
+
+    def unsubscribe(self, entry_id: str):
+        """Удаляет подписку на запись и возвращает её (None, если подписки не было)."""
+        return self.subscriptions.pop(entry_id, None)
+
+    def heartbeat(self):
+        """Любое сообщение по соединению подтверждает жизнь всех подписок."""
+        for subscription in self.subscriptions.values():
+            subscription.heartbeat()
+
+    def start(self):
+        self._writer_task = asyncio.create_task(self._writer())
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while not self.closed:
+            self.wakeup.clear()
+            delay = None
+            for subscription in tuple(self.subscriptions.values()):
+                if subscription.closed or subscription._pending is None:
+                    continue
+                wait = subscription.next_send - loop.time()
+                if wait > 0:
+                    # Кадр дождётся своей очереди; до тех пор его может заменить более свежий
+                    delay = wait if delay is None else min(delay, wait)
+                    continue
+                data = subscription.render(subscription.take())
+                if not data:
+                    continue
+                if isinstance(data, str):
+                    data = data.encode()
+                try:
+                    await self.ws.send_bytes(subscription.tag + data)
+                except Exception as e:
+                    _LOGGER.debug("Send to multiplexed client %s failed: %s", self.remote, e)
+                    self.abort("send error")
+                    return
+                subscription.frames_sent += 1
+                if subscription.max_fps:
+                    subscription.next_send = loop.time() + 1 / subscription.max_fps
+            if delay is None:
+                await self.wakeup.wait()
+                continue
+            try:
+                async with async_timeout.timeout(delay):
+                    await self.wakeup.wait()
+            except asyncio.TimeoutError:
+                pass
+
+    def abort(self, reason: str):
+        """Разрывает соединение; основной цикл WledWSMuxView.get завершится и отпишет все записи."""
+        if self.closed:
+            return
+        self.closed = True
+        _LOGGER.debug("Dropping multiplexed client %s: %s", self.remote, reason)
+        for subscription in self.subscriptions.values():
+            subscription.closed = True
+        self.wakeup.set()
+        transport = self.request.transport
+        if transport is not None and not transport.is_closing():
+            transport.abort()
+
+    async def async_stop(self):
+        """Останавливает писателя (вызывается при отключении клиента)."""
+        self.closed = True
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
@@ -1,6 +1,7 @@
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.const import STATE_UNKNOWN
 from .const import DOMAIN
+from .views import delta_compression
 import logging
 
 _LOGGER = logging.getLogger(__name__)
@@ -11,6 +12,10 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
 class WledWebSocketSensor(SensorEntity):
     _attr_has_entity_name = True
     _attr_name = None
+    # Счётчики кадров меняются постоянно – не сохраняем их в recorder
+    _unrecorded_attributes = frozenset({
+        "frames_dropped", "clients", "visible_clients", "reaped_clients", "frames_received", "frames_suppressed", "delta_compression",
+    })
 
     def __init__(self, config_entry, hass):
         self.hass = hass
@@ -28,13 +33,12 @@ class WledWebSocketSensor(SensorEntity):
     def state(self):
         """
         Основное состояние сенсора – количество активных клиентских WS-соединений.
-        Данные берутся из hass.data[DOMAIN][entry_id]["connections"].
+        Данные берутся из hass.data[DOMAIN][entry_id]["connections"]; клиенты, уже закрытые
+        по истечении heartbeat, но ещё не удалённые, не учитываются.
         """
-        domain_entry = self.hass.data.get(DOMAIN, {}).get(self._entry_id, {})
-        connections = domain_entry.get("connections", {})
-        client_list = connections.get("client_ws_list", [])
-        _LOGGER.debug(f"[{self._entry_id}] WLED Sensor: State queried, active clients: {len(client_list)}")
-        return len(client_list)
+        active = sum(1 for client in self._clients() if not client.closed)
+        _LOGGER.debug(f"[{self._entry_id}] WLED Sensor: State queried, active clients: {active}")
+        return active
 
     @property
     def extra_state_attributes(self):
@@ -42,15 +46,42 @@ class WledWebSocketSensor(SensorEntity):
         Дополнительные атрибуты сенсора:
           - entry_id для идентификации,
           - device_on – состояние устройства (ключ "state" → "on" из JSON),
-          - native_ws – количество подключенных WS-клиентов (ключ "info" → "ws" из JSON).
-        Данные берутся из hass.data[DOMAIN][entry_id]["device_state"].
+          - native_ws – количество подключенных WS-клиентов (ключ "info" → "ws" из JSON),
+          - frames_dropped и clients – счётчики отправленных и пропущенных кадров по каждому клиенту,
+            чтобы было видно, кто из зрителей отстаёт (не записываются в историю; адрес клиента "remote"
+            не публикуется, как и в диагностике),
+          - active_clients и reaped_clients – число активных клиентов и клиентов, закрытых
+            из-за отсутствия heartbeat,
+          - visible_clients – число клиентов, чья карточка сейчас на экране (только им отправляются кадры),
+          - frames_received и frames_suppressed – кадры, полученные от WLED, и повторяющиеся кадры,
+            которые не рассылались клиентам,
+          - delta_compression – во сколько раз дельта-формат уменьшил объём кадров (None, если не использовался).
+        Состояние устройства берётся из общего хранилища записи (upstream.DeviceStateStore).
         """
         domain_entry = self.hass.data.get(DOMAIN, {}).get(self._entry_id, {})
-        full_state = domain_entry.get("device_state", {})
+        store = self._state_store()
+        full_state = store.data if store is not None else {}
         device_on = full_state.get("state", {}).get("on")
         native_ws = full_state.get("info", {}).get("ws")
+        connections = domain_entry.get("connections", {})
+        clients = [
+            {key: value for key, value in client.as_dict().items() if key != "remote"}
+            for client in self._clients() if not client.closed
+        ]
         _LOGGER.debug(f"[{self._entry_id}] WLED Sensor: extra_state_attributes queried: device_on={device_on}, native_ws={native_ws}")
-        return {"entry_id": self._entry_id, "device_on": device_on, "native_ws": native_ws}
+        return {
+            "entry_id": self._entry_id,
+            "device_on": device_on,
+            "native_ws": native_ws,
+            "frames_dropped": sum(client["frames_dropped"] for client in clients),
+            "clients": clients,
+            "active_clients": len(clients),
+            "visible_clients": sum(1 for client in clients if client["visible"]),
+            "reaped_clients": connections.get("reaped", 0),
+            "frames_received": connections.get("frames_received", 0),
+            "frames_suppressed": connections.get("frames_suppressed", 0),
+            "delta_compression": delta_compression(connections.get("delta_stats")),
+        }
 
     @property
     def device_info(self):
@@ -73,7 +104,24 @@ class WledWebSocketSensor(SensorEntity):
                 return coordinator.device_available
         return True
 
+    def _clients(self):
+        """Клиенты live-view этой записи (множество LiveViewClient)."""
+        domain_entry = self.hass.data.get(DOMAIN, {}).get(self._entry_id, {})
+        return domain_entry.get("connections", {}).get("clients", ())
+
+    def _state_store(self):
+        """Общее хранилище состояния устройства для этой записи или None, если запись не загружена."""
+        upstream = self.hass.data.get(DOMAIN, {}).get("upstream", {}).get(self._entry_id)
+        return upstream.state_store if upstream is not None else None
+
     async def async_added_to_hass(self):
+        store = self._state_store()
+        if store is not None:
+            # Push-обновления состояния сразу отражаются в атрибутах сенсора
+            self.async_on_remove(store.add_listener(self.async_write_ha_state))
+            if not store.data and not self._config.get("control", False):
+                # Без режима control постоянного соединения нет – запрашиваем состояние один раз
+                self.hass.async_create_task(store.async_refresh())
         if self._config.get("control", False):
             coordinator = self.hass.data.get(DOMAIN, {}).get("coordinator", {}).get(self._entry_id)
             if coordinator:
@@ -83,13 +131,6 @@ class WledWebSocketSensor(SensorEntity):
                 _LOGGER.debug(f"[{self._entry_id}] WLED Sensor: Coordinator not found during hass startup.")
 
     def _handle_coordinator_update(self):
+        # Состояние устройства уже попало в общее хранилище; здесь обновляем доступность
         _LOGGER.debug(f"[{self._entry_id}] WLED Sensor: _handle_coordinator_update called.")
-        coordinator = self.hass.data.get(DOMAIN, {}).get("coordinator", {}).get(self._entry_id)
-        if coordinator and coordinator.data:
-            domain_data = self.hass.data.setdefault(DOMAIN, {})
-            entry_data = domain_data.setdefault(self._entry_id, {})
-            entry_data["device_state"] = coordinator.data
-            _LOGGER.debug(f"[{self._entry_id}] WLED Sensor: Updated device_state: {coordinator.data}")
-        else:
-            _LOGGER.debug(f"[{self._entry_id}] WLED Sensor: No data received from coordinator.")
         self.async_write_ha_state()
\ No newline at end of file
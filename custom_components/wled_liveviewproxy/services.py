@@ -1,5 +1,7 @@
+import asyncio
 import json
 import logging
+import time
 import voluptuous as vol
 
 from homeassistant.core import HomeAssistant, ServiceCall, HomeAssistantError, SupportsResponse
@@ -10,81 +12,143 @@ from .const import DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
+DEFAULT_TIMEOUT = 5.0
+
 # Обновлённая схема сервиса
 SEND_COMMAND_SCHEMA = vol.Schema({
-    "targets": vol.Schema({
+    vol.Optional("targets", default={}): vol.Schema({
         "device_id": vol.Optional(vol.All(cv.ensure_list, [cv.string]), default=[]),
         "entity_id": vol.Optional(vol.All(cv.ensure_list, [cv.string]), default=[]),
     }),
-    "command": dict,  # Теперь ожидается, что command уже dict, а не строка.
+    vol.Optional("command"): dict,  # Теперь ожидается, что command уже dict, а не строка.
+    # Индивидуальные команды: {device_id или entity_id: {...}}; имеют приоритет над command
+    vol.Optional("device_commands"): vol.Schema({cv.string: dict}),
+    # Таймаут ожидания ответа для каждого устройства (секунды)
+    vol.Optional("timeout", default=DEFAULT_TIMEOUT): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=60)),
 })
 
+def _resolve_device_id(entity_registry, target: str):
+    """Возвращает device_id для device_id или entity_id (None, если сущность не связана с устройством)."""
+    if "." not in target:
+        return target
+    entity_entry = entity_registry.async_get(target)
+    if entity_entry and entity_entry.device_id:
+        _LOGGER.debug(f"[{target}] Added device_id {entity_entry.device_id} from entity {target}")
+        return entity_entry.device_id
+    _LOGGER.error(f"[{target}] Entity does not have an associated device")
+    return None
+
+async def _send_to_device(device_id: str, coordinator, command: dict, timeout: float) -> dict:
+    """
+    Отправляет команду одному устройству и возвращает результат:
+    status (ok/timeout/error), latency_ms, response и error.
+    """
+    config_entry_id = coordinator.entry_id
+    _LOGGER.debug(f"[{config_entry_id}] Sending command: {command}")
+    result = {
+        "device_id": device_id,
+        "name": coordinator.config_entry.data.get("name", config_entry_id),
+        "status": "ok",
+        "latency_ms": None,
+        "response": None,
+    }
+    started = time.monotonic()
+    try:
+        result["response"] = await coordinator.send_command(command, timeout=timeout, raise_errors=True)
+    except asyncio.TimeoutError:
+        result["status"] = "timeout"
+    except Exception as e:
+        _LOGGER.error(f"[{config_entry_id}] Error sending command for device: {e}")
+        result["status"] = "error"
+        result["error"] = str(e)
+    result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+    _LOGGER.debug(f"[{config_entry_id}] Command result for device {result['name']}: {result['status']} "
+                  f"in {result['latency_ms']} ms")
+    return result
+
 async def handle_send_command(call: ServiceCall):
     """
     Обработчик сервиса send_command.
-    Извлекает выбранные устройства из call.data['targets'] (из device_id и entity_id),
-    получает поле command (уже как dict), отправляет команду через координатор и возвращает ответ.
+    Извлекает выбранные устройства из call.data['targets'] (из device_id и entity_id) и из ключей
+    device_commands, отправляет каждому устройству его команду (device_commands или общую command)
+    одновременно через координаторы и возвращает ответы.
+
+    Ответ сервиса:
+      - "responses": {имя устройства: ответ WLED} – только успешные ответы;
+      - "results": {device_id: {name, status, latency_ms, response[, error]}}, status – ok/timeout/error.
     """
     responses = {}
+    results = {}
 
     # Извлекаем данные из ключа targets
     targets = call.data.get("targets", {})
-    device_ids = targets.get("device_id", [])
+    device_ids = list(targets.get("device_id", []))
     entity_ids = targets.get("entity_id", [])
+    command = call.data.get("command")
+    timeout = call.data.get("timeout", DEFAULT_TIMEOUT)
+    entity_registry = async_get_entity_registry(call.hass)
 
     # Если выбраны сущности, получаем связанные device_id из реестра сущностей
-    if entity_ids:
-        entity_registry = async_get_entity_registry(call.hass)
-        for entity_id in entity_ids:
-            entity_entry = entity_registry.async_get(entity_id)
-            if entity_entry and entity_entry.device_id:
-                device_ids.append(entity_entry.device_id)
-                _LOGGER.debug(f"[{entity_id}] Added device_id {entity_entry.device_id} from entity {entity_id}")
-            else:
-                _LOGGER.error(f"[{entity_id}] Entity does not have an associated device")
-    
+    for entity_id in entity_ids:
+        device_id = _resolve_device_id(entity_registry, entity_id)
+        if device_id:
+            device_ids.append(device_id)
+
+    # Индивидуальные команды: устройства из device_commands также становятся целями
+    device_commands = {}
+    for target, device_command in (call.data.get("device_commands") or {}).items():
+        device_id = _resolve_device_id(entity_registry, target)
+        if device_id:
+            device_commands[device_id] = device_command
+            device_ids.append(device_id)
+
     # Если список устройств пуст, выводим предупреждение
     if not device_ids:
         _LOGGER.warning("No devices selected for sending command")
-        return {"responses": responses}
+        return {"responses": responses, "results": results}
 
-    # Получаем поле command уже как dict
-    command = call.data.get("command")
-    if not isinstance(command, dict):
+    if command is not None and not isinstance(command, dict):
         raise HomeAssistantError("Command must be a JSON object")
+    if command is None and not device_commands:
+        raise HomeAssistantError("Either command or device_commands must be provided")
 
     device_registry = async_get_device_registry(call.hass)
 
-    # Для каждого уникального device_id
-    for device_id in set(device_ids):
+    # Для каждого уникального device_id готовим отправку; отправки выполняются одновременно
+    sends = []
+    for device_id in dict.fromkeys(device_ids):
         device_entry = device_registry.async_get(device_id)
         if not device_entry:
             _LOGGER.error(f"[{device_id}] Device not found")
+            results[device_id] = {"device_id": device_id, "status": "error", "error": "Device not found"}
             continue
 
         # Получаем config_entry_id, взяв первый элемент из множества
         config_entry_ids = device_entry.config_entries
         if not config_entry_ids:
             _LOGGER.error(f"[{device_id}] No config entry found for device")
+            results[device_id] = {"device_id": device_id, "status": "error", "error": "No config entry found"}
             continue
         config_entry_id = next(iter(config_entry_ids))
 
-        # Логируем информацию о направлении команды
-        _LOGGER.debug(f"[{config_entry_id}] Sending command: {command}")
-
         # Ищем координатор по config_entry_id
         coordinator = call.hass.data.get(DOMAIN, {}).get("coordinator", {}).get(config_entry_id)
-        if coordinator:
-            try:
-                response = await coordinator.send_command(command)
-                device_name = coordinator.config_entry.data.get("name", config_entry_id)
-                responses[device_name] = response
-                _LOGGER.debug(f"[{config_entry_id}] Command sent for device {device_name}, response: {response}")
-            except Exception as e:
-                _LOGGER.error(f"[{config_entry_id}] Error sending command for device: {e}")
-        else:
+        if not coordinator:
             _LOGGER.error(f"[{config_entry_id}] Coordinator not found")
-    return {"responses": responses}
+            results[device_id] = {"device_id": device_id, "status": "error", "error": "Coordinator not found"}
+            continue
+
+        device_command = device_commands.get(device_id, command)
+        if device_command is None:
+            continue
+        sends.append(_send_to_device(device_id, coordinator, device_command, timeout))
+
+    # Недоступное устройство задерживает только свой результат, а не всю рассылку
+    for result in await asyncio.gather(*sends):
+        results[result["device_id"]] = result
+        if result["status"] == "ok":
+            responses[result["name"]] = result["response"]
+    return {"responses": responses, "results": results}
 
 def async_register_send_command_service(hass: HomeAssistant):
     """
@@ -0,0 +1,116 @@
+"""
+session.py
+
+Общая aiohttp-сессия интеграции с пулом keep-alive соединений.
+Её используют общее WS-соединение (upstream), разовые HTTP-запросы состояния,
+загрузка эффектов координатором и config flow – вместо отдельной ClientSession на каждый вызов.
+Число одновременных соединений с одним устройством ограничено, статистика пула
+доступна в диагностике записи.
+"""
+
+import logging
+import aiohttp
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import HomeAssistant, callback
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# Ограничения пула: ESP обслуживает лишь несколько одновременных TCP-соединений
+POOL_LIMIT = 64
+POOL_LIMIT_PER_HOST = 4
+KEEPALIVE_TIMEOUT = 30
+DNS_CACHE_TTL = 300
+
+DATA_SESSION = "session"
+DATA_SESSION_STATS = "session_stats"
+
+
+def _build_trace_config(stats: dict) -> aiohttp.TraceConfig:
+    """Счётчики пула на основе трассировки aiohttp: новые и переиспользованные соединения, запросы, ошибки."""
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        stats["requests"] += 1
+
+    async def on_request_exception(session, context, params):
+        stats["request_errors"] += 1
+
+    async def on_connection_create_end(session, context, params):
+        stats["connections_created"] += 1
+
+    async def on_connection_reuseconn(session, context, params):
+        stats["connections_reused"] += 1
+
+    async def on_connection_queued_start(session, context, params):
+        stats["connections_queued"] += 1
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_exception.append(on_request_exception)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_connection_queued_start.append(on_connection_queued_start)
+    return trace_config
+
+
+@callback
+def async_get_session(hass: HomeAssistant) -> aiohttp.ClientSession:
+    """Возвращает общую сессию интеграции, создавая её при первом обращении."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    session = domain_data.get(DATA_SESSION)
+    if session is not None and not session.closed:
+        return session
+
+    stats = domain_data.setdefault(DATA_SESSION_STATS, {
+        "requests": 0,
+        "request_errors": 0,
+        "connections_created": 0,
+        "connections_reused": 0,
+        "connections_queued": 0,
+    })
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+    )
+    session = aiohttp.ClientSession(connector=connector, trace_configs=[_build_trace_config(stats)])
+    domain_data[DATA_SESSION] = session
+    _LOGGER.debug("Created pooled client session (limit=%s, limit_per_host=%s).", POOL_LIMIT, POOL_LIMIT_PER_HOST)
+
+    async def _async_close_on_stop(event):
+        await async_close_session(hass)
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _async_close_on_stop)
+    return session
+
+
+async def async_close_session(hass: HomeAssistant):
+    """Закрывает общую сессию (остановка HA или выгрузка последней записи)."""
+    session = hass.data.get(DOMAIN, {}).pop(DATA_SESSION, None)
+    if session is not None and not session.closed:
+        await session.close()
+        _LOGGER.debug("Pooled client session closed.")
+
+
+@callback
+def async_get_session_stats(hass: HomeAssistant) -> dict:
+    """Статистика пула соединений для диагностики."""
+    domain_data = hass.data.get(DOMAIN, {})
+    stats = dict(domain_data.get(DATA_SESSION_STATS, {}))
+    session = domain_data.get(DATA_SESSION)
+    if session is None or session.closed:
+        stats["active"] = False
+        return stats
+    connector = session.connector
+    stats.update({
+        "active": True,
+        "limit": connector.limit,
+        "limit_per_host": connector.limit_per_host,
+        # Число открытых соединений в пуле (занятые + простаивающие keep-alive)
+        "open_connections": len(getattr(connector, "_acquired", ())) + sum(
+            len(conns) for conns in getattr(connector, "_conns", {}).values()
+        ),
+        "idle_connections": sum(len(conns) for conns in getattr(connector, "_conns", {}).values()),
+    })
+    return stats
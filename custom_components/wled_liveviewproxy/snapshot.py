@@ -0,0 +1,70 @@
+"""
+snapshot.py
+
+Сохраняемые снимки последнего известного состояния устройств (state, info и ключ списка эффектов).
+При запуске HA координатор сразу восстанавливает данные из снимка, а обновление с устройства
+выполняется в фоне, не задерживая загрузку интеграции. Снимки всех записей хранятся
+в одном файле хранилища HA; запись на диск откладывается и объединяется (async_delay_save).
+"""
+
+import asyncio
+import logging
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.snapshots"
+SAVE_DELAY = 30
+
+DATA_SNAPSHOTS = "snapshots"
+
+
+class SnapshotStore:
+    """Снимки состояния устройств, общие для всех записей интеграции."""
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._snapshots = {}
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+
+    async def async_load(self):
+        async with self._load_lock:
+            if self._loaded:
+                return
+            stored = await self._store.async_load()
+            if isinstance(stored, dict):
+                self._snapshots = stored.get("entries", {})
+            self._loaded = True
+            _LOGGER.debug("Loaded %s device state snapshots.", len(self._snapshots))
+
+    def get(self, entry_id: str):
+        """Снимок записи или None."""
+        return self._snapshots.get(entry_id)
+
+    def update(self, entry_id: str, state: dict, info: dict, effects_key=None):
+        """Обновляет снимок записи; запись на диск выполняется с задержкой SAVE_DELAY."""
+        if not self._loaded:
+            return
+        self._snapshots[entry_id] = {"state": state, "info": info, "effects_key": effects_key}
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def remove(self, entry_id: str):
+        if self._snapshots.pop(entry_id, None) is not None:
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def _data_to_save(self) -> dict:
+        return {"entries": self._snapshots}
+
+
+def async_get_snapshot_store(hass: HomeAssistant) -> SnapshotStore:
+    """Возвращает общее хранилище снимков, создавая его при первом обращении."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    store = domain_data.get(DATA_SNAPSHOTS)
+    if store is None:
+        store = domain_data[DATA_SNAPSHOTS] = SnapshotStore(hass)
+    return store
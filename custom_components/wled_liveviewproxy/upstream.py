@@ -0,0 +1,463 @@
+"""
+upstream.py
+
+Единственное WebSocket-соединение с устройством WLED для каждой записи интеграции.
+Координатор (режим control) и live-view прокси не открывают собственных сокетов,
+а подписываются на общее соединение:
+  - JSON с ключом "state" передаётся слушателям EVENT_STATE;
+  - ответы {"success": ...} и прочие JSON-ответы – слушателям EVENT_RESPONSE;
+  - бинарные live-кадры – слушателям EVENT_FRAME;
+  - изменения доступности устройства (подключение, потеря pong) – слушателям EVENT_AVAILABILITY;
+  - каждое исходящее сообщение перед отправкой – слушателям EVENT_SEND (сопоставление ответов с командами).
+
+Соединение держится, пока есть хотя бы один «держатель» (HOLDER_CONTROL, HOLDER_LIVE).
+Команда {"lv":true} отправляется только пока есть держатель HOLDER_LIVE и повторяется после переподключения.
+Переподключение выполняется с экспоненциальной задержкой и случайным разбросом (см. reconnect_delay);
+первые попытки быстрые, после успешного подключения задержка сбрасывается, wake() прерывает ожидание.
+
+DeviceStateStore – общее для записи хранилище последнего JSON-состояния ("state" + "info"),
+из которого читают live-view и сенсор вместо отдельных запросов к устройству.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+import aiohttp
+import async_timeout
+from .session import async_get_session
+
+_LOGGER = logging.getLogger(__name__)
+
+EVENT_STATE = "state"
+EVENT_RESPONSE = "response"
+EVENT_FRAME = "frame"
+EVENT_AVAILABILITY = "availability"
+EVENT_SEND = "send"
+
+HOLDER_CONTROL = "control"
+HOLDER_LIVE = "live"
+
+# Задержки переподключения: быстрые первые попытки, затем экспоненциальный рост до предела
+RECONNECT_FAST_RETRIES = 2
+RECONNECT_FAST_DELAY = 0.5
+RECONNECT_BASE_DELAY = 2
+RECONNECT_MAX_DELAY = 300
+RECONNECT_JITTER = 0.2
+PING_INTERVAL = 5
+PONG_TIMEOUT = 15
+STATE_REQUEST_TIMEOUT = 5
+
+
+def reconnect_delay(failures: int) -> float:
+    """
+    Задержка перед очередной попыткой после failures неудачных попыток подряд:
+    RECONNECT_FAST_RETRIES быстрых попыток, затем RECONNECT_BASE_DELAY * 2^n с разбросом ±RECONNECT_JITTER,
+    но не более RECONNECT_MAX_DELAY. Разброс разводит во времени попытки многих выключенных устройств.
+    """
+    if failures <= RECONNECT_FAST_RETRIES:
+        return RECONNECT_FAST_DELAY
+    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (failures - RECONNECT_FAST_RETRIES - 1))
+    return min(RECONNECT_MAX_DELAY, delay * random.uniform(1 - RECONNECT_JITTER, 1 + RECONNECT_JITTER))
+
+
+class WledUpstream:
+    """Общее WS-соединение с WLED, к которому подключаются координатор и live-view прокси."""
+
+    def __init__(self, hass, entry_id: str, wled_ip: str):
+        self.hass = hass
+        self.entry_id = entry_id
+        self.wled_ip = wled_ip
+        self.ws = None
+        self.available = None  # None – ещё не было ни одной попытки подключения
+        self._holders = set()
+        self._listeners = {
+            EVENT_STATE: [],
+            EVENT_RESPONSE: [],
+            EVENT_FRAME: [],
+            EVENT_AVAILABILITY: [],
+            EVENT_SEND: [],
+        }
+        self._send_lock = asyncio.Lock()
+        self._task = None
+        self._wake_event = asyncio.Event()
+        # Метрики переподключения для диагностики
+        self._down_since = None
+        self.reconnect_stats = {
+            "attempts": 0,
+            "failures": 0,
+            "consecutive_failures": 0,
+            "connections": 0,
+            "current_delay": None,
+            "total_downtime": 0.0,
+            "last_connected_at": None,
+            "last_disconnected_at": None,
+        }
+        # Последнее состояние устройства, поддерживаемое push-обновлениями этого соединения
+        self.state_store = DeviceStateStore(self)
+        _LOGGER.debug("[%s] Upstream initialized for WLED at %s", entry_id, wled_ip)
+
+    @property
+    def connected(self) -> bool:
+        return self.ws is not None and not self.ws.closed
+
+    @property
+    def live(self) -> bool:
+        return HOLDER_LIVE in self._holders
+
+    def add_listener(self, event: str, callback):
+        """Подписывает callback на событие соединения. Возвращает функцию отписки."""
+        listeners = self._listeners[event]
+        listeners.append(callback)
+
+        def remove_listener():
+            if callback in listeners:
+                listeners.remove(callback)
+
+        return remove_listener
+
+    def _notify(self, event: str, data):
+        for callback in list(self._listeners[event]):
+            try:
+                callback(data)
+            except Exception as e:
+                _LOGGER.error("[%s] Error in %s listener: %s", self.entry_id, event, e)
+
+    def acquire(self, holder: str):
+        """
+        Регистрирует потребителя соединения и при необходимости запускает его.
+        Для HOLDER_LIVE на устройство отправляется {"lv":true}.
+        """
+        if holder in self._holders:
+            return
+        self._holders.add(holder)
+        _LOGGER.debug("[%s] Upstream acquired by %s, holders: %s", self.entry_id, holder, self._holders)
+        if holder == HOLDER_LIVE and self.connected:
+            self.hass.async_create_task(self._send_live(True))
+        if self._task is None or self._task.done():
+            self._task = self.hass.async_create_background_task(
+                self._run(), f"{self.entry_id} wled_liveviewproxy upstream"
+            )
+
+    def release(self, holder: str):
+        """
+        Снимает потребителя. Для HOLDER_LIVE отправляется {"lv":false};
+        когда держателей не остаётся, соединение закрывается.
+        """
+        if holder not in self._holders:
+            return
+        self._holders.discard(holder)
+        _LOGGER.debug("[%s] Upstream released by %s, holders: %s", self.entry_id, holder, self._holders)
+        if holder == HOLDER_LIVE and self.connected:
+            self.hass.async_create_task(self._send_live(False))
+        if not self._holders and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def send_str(self, data: str):
+        """
+        Отправляет строку в общее соединение. Бросает исключение, если соединения нет.
+        Слушатели EVENT_SEND уведомляются под блокировкой отправки, то есть в порядке отправки сообщений.
+        """
+        async with self._send_lock:
+            if not self.connected:
+                raise ConnectionError("No active WS connection.")
+            self._notify(EVENT_SEND, data)
+            await self.ws.send_str(data)
+
+    async def send_json(self, payload: dict):
+        await self.send_str(json.dumps(payload))
+
+    async def async_request_state(self):
+        """Запрашивает полное состояние {"v": true}; ответ придёт слушателям EVENT_STATE."""
+        if not self.connected:
+            _LOGGER.debug("[%s] State requested without active connection, will be sent on connect.", self.entry_id)
+            return
+        try:
+            await self.send_str('{"v": true}')
+        except Exception as e:
+            _LOGGER.debug("[%s] Error requesting state: %s", self.entry_id, e)
+
+    async def _send_live(self, enabled: bool):
+        try:
+            _LOGGER.debug("[%s] Sending live preview command: lv=%s", self.entry_id, enabled)
+            await self.send_json({"lv": enabled})
+        except Exception as e:
+            _LOGGER.debug("[%s] Error sending live preview command: %s", self.entry_id, e)
+
+    async def async_resend_live(self):
+        """Повторно включает live-поток ({"lv":true}), если есть держатель HOLDER_LIVE."""
+        if self.live and self.connected:
+            await self._send_live(True)
+
+    async def async_reconnect(self):
+        """Закрывает текущий сокет; цикл соединения сразу переподключается (сбой не засчитывается)."""
+        ws = self.ws
+        if ws is not None and not ws.closed:
+            _LOGGER.debug("[%s] Forcing upstream reconnect.", self.entry_id)
+            await ws.close()
+
+    def _set_available(self, available: bool):
+        if self.available == available:
+            return
+        self.available = available
+        now = time.monotonic()
+        if available:
+            if self._down_since is not None:
+                self.reconnect_stats["total_downtime"] += now - self._down_since
+                self._down_since = None
+        elif self._down_since is None:
+            self._down_since = now
+        self._notify(EVENT_AVAILABILITY, available)
+
+    def wake(self):
+        """Прерывает ожидание перед переподключением (например, при отправке команды)."""
+        if not self.connected and self._task is not None and not self._task.done():
+            _LOGGER.debug("[%s] Reconnect wake-up requested.", self.entry_id)
+            self._wake_event.set()
+
+    def get_reconnect_stats(self) -> dict:
+        """Метрики переподключения, включая текущий простой."""
+        stats = dict(self.reconnect_stats)
+        downtime = stats["total_downtime"]
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        stats["total_downtime"] = round(downtime, 1)
+        stats["current_downtime"] = round(time.monotonic() - self._down_since, 1) if self._down_since else 0.0
+        return stats
+
+    async def _run(self):
+        stats = self.reconnect_stats
+        try:
+            while self._holders:
+                _LOGGER.debug("[%s] Connecting to WLED at IP: %s", self.entry_id, self.wled_ip)
+                self._wake_event.clear()
+                stats["attempts"] += 1
+                if await self._connect_once():
+                    # Соединение было установлено: следующая попытка снова быстрая
+                    stats["consecutive_failures"] = 0
+                else:
+                    stats["failures"] += 1
+                    stats["consecutive_failures"] += 1
+                if not self._holders:
+                    break
+                delay = reconnect_delay(stats["consecutive_failures"])
+                stats["current_delay"] = round(delay, 2)
+                _LOGGER.debug("[%s] WS connection ended, waiting %.1f seconds before reconnecting.",
+                              self.entry_id, delay)
+                try:
+                    async with async_timeout.timeout(delay):
+                        await self._wake_event.wait()
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            stats["current_delay"] = None
+            self._set_available(False)
+
+    async def _connect_once(self) -> bool:
+        """
+        Одна сессия соединения: подключение, запрос {"v": true}, {"lv":true} при наличии зрителей,
+        механизм ping/pong и разбор входящих сообщений.
+        Если за PONG_TIMEOUT секунд не получен pong, устройство помечается как недоступное и соединение закрывается.
+        Возвращает True, если соединение было установлено.
+        """
+        entry_id = self.entry_id
+        ping_task = None
+        ws = None
+        try:
+            session = async_get_session(self.hass)
+            _LOGGER.debug("[%s] Attempting to connect to WLED at ws://%s/ws", entry_id, self.wled_ip)
+            async with async_timeout.timeout(10):
+                ws = await session.ws_connect(f"ws://{self.wled_ip}/ws")
+            _LOGGER.debug("[%s] Successfully connected to WLED at ws://%s/ws", entry_id, self.wled_ip)
+            self.ws = ws
+            self.reconnect_stats["connections"] += 1
+            self.reconnect_stats["last_connected_at"] = time.time()
+            self._set_available(True)
+
+            _LOGGER.debug("[%s] Sending command {\"v\": true} to request full JSON state.", entry_id)
+            await self.send_str('{"v": true}')
+            if self.live:
+                await self._send_live(True)
+
+            last_pong = time.monotonic()
+
+            async def ping_loop():
+                while True:
+                    await asyncio.sleep(PING_INTERVAL)
+                    try:
+                        _LOGGER.debug("[%s] Sending ping to WLED.", entry_id)
+                        await self.send_str("ping")
+                    except Exception as e:
+                        _LOGGER.error("[%s] Error sending ping: %s", entry_id, e)
+                        break
+                    if time.monotonic() - last_pong > PONG_TIMEOUT:
+                        if self.available:
+                            _LOGGER.error("[%s] No pong received within %s seconds, device unavailable.",
+                                          entry_id, PONG_TIMEOUT)
+                            self._set_available(False)
+                        await ws.close()
+                        break
+
+            ping_task = asyncio.create_task(ping_loop())
+
+            while True:
+                try:
+                    async with async_timeout.timeout(10):
+                        msg = await ws.receive()
+                except asyncio.TimeoutError:
+                    _LOGGER.debug("[%s] No message received within 10 seconds, continuing to wait.", entry_id)
+                    continue
+
+                if msg.type == aiohttp.WSMsgType.BINARY:
+                    self._notify(EVENT_FRAME, msg.data)
+                elif msg.type == aiohttp.WSMsgType.TEXT:
+                    if msg.data.strip().lower() == "pong":
+                        _LOGGER.debug("[%s] Received pong from WLED.", entry_id)
+                        last_pong = time.monotonic()
+                        if not self.available:
+                            _LOGGER.info("[%s] Device is available again.", entry_id)
+                            self._set_available(True)
+                        continue
+                    try:
+                        json_data = json.loads(msg.data)
+                    except ValueError as e:
+                        _LOGGER.error("[%s] Error parsing JSON: %s", entry_id, e)
+                        continue
+                    _LOGGER.debug("[%s] Parsed JSON data: %s", entry_id, json_data)
+                    if isinstance(json_data, dict) and "state" in json_data:
+                        self._notify(EVENT_STATE, json_data)
+                    else:
+                        self._notify(EVENT_RESPONSE, json_data)
+                elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING,
+                                  aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    _LOGGER.debug("[%s] WebSocket closed or encountered error, will reconnect.", entry_id)
+                    break
+                else:
+                    _LOGGER.debug("[%s] Received unrecognized message type: %s", entry_id, msg.type)
+
+            _LOGGER.debug("[%s] Exiting message loop, closing WebSocket connection.", entry_id)
+            await ws.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            if self.available is not False:
+                _LOGGER.error("[%s] Error connecting to WLED via WebSocket: %s", entry_id, err)
+            else:
+                _LOGGER.debug("[%s] Error connecting to WLED via WebSocket (device already unavailable): %s",
+                              entry_id, err)
+            self._set_available(False)
+        finally:
+            if ping_task is not None:
+                ping_task.cancel()
+            # Сессия общая – закрываем только собственный сокет
+            if ws is not None and not ws.closed:
+                await ws.close()
+            if self.ws is not None:
+                self.reconnect_stats["last_disconnected_at"] = time.time()
+            self.ws = None
+        return ws is not None
+
+    async def async_shutdown(self):
+        """Закрывает соединение и снимает всех держателей (выгрузка записи)."""
+        _LOGGER.debug("[%s] Shutting down upstream.", self.entry_id)
+        self._holders.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.ws is not None:
+            try:
+                await self.ws.close()
+            except Exception as e:
+                _LOGGER.error("[%s] Error closing WS during shutdown: %s", self.entry_id, e)
+            self.ws = None
+
+
+class DeviceStateStore:
+    """
+    Последнее полное состояние устройства для записи.
+    Обновляется push-сообщениями общего соединения; разовый запрос к устройству выполняется,
+    только когда соединения нет, и одновременные запросы объединяются в один.
+    """
+
+    def __init__(self, upstream: WledUpstream):
+        self.upstream = upstream
+        self.entry_id = upstream.entry_id
+        self.data = {}
+        self.updated_at = None
+        self.fetch_count = 0
+        self._listeners = []
+        self._waiters = []
+        self._refresh_task = None
+        upstream.add_listener(EVENT_STATE, self._handle_state)
+
+    def add_listener(self, callback):
+        """Подписывает callback() на изменения состояния. Возвращает функцию отписки."""
+        self._listeners.append(callback)
+
+        def remove_listener():
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+        return remove_listener
+
+    def _handle_state(self, json_data: dict):
+        self.update(json_data)
+
+    def update(self, json_data: dict):
+        """Сохраняет состояние; сообщения без "info" обновляют только "state"."""
+        if "info" in json_data:
+            self.data = json_data
+        else:
+            self.data = {**self.data, "state": json_data["state"]}
+        self.updated_at = time.time()
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(self.data)
+        self._waiters.clear()
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception as e:
+                _LOGGER.error("[%s] Error in state store listener: %s", self.entry_id, e)
+
+    async def async_refresh(self) -> dict:
+        """
+        Обновляет состояние и возвращает его.
+        При активном соединении – запрос {"v": true} по нему; иначе – разовый HTTP-запрос /json/si.
+        Одновременные вызовы ожидают одну и ту же задачу.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._async_do_refresh())
+        return await asyncio.shield(self._refresh_task)
+
+    async def _async_do_refresh(self) -> dict:
+        try:
+            if self.upstream.connected:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                await self.upstream.async_request_state()
+                async with async_timeout.timeout(STATE_REQUEST_TIMEOUT):
+                    return await waiter
+            return await self._async_fetch_once()
+        except Exception as e:
+            _LOGGER.debug("[%s] Error refreshing device state: %s", self.entry_id, e)
+            return self.data
+
+    async def _async_fetch_once(self) -> dict:
+        """Разовый запрос состояния по HTTP, когда live-источника нет."""
+        self.fetch_count += 1
+        _LOGGER.debug("[%s] No live connection, fetching device state from http://%s/json/si",
+                      self.entry_id, self.upstream.wled_ip)
+        session = async_get_session(self.upstream.hass)
+        async with async_timeout.timeout(STATE_REQUEST_TIMEOUT):
+            async with session.get(f"http://{self.upstream.wled_ip}/json/si") as response:
+                json_data = await response.json(content_type=None)
+        if isinstance(json_data, dict) and "state" in json_data:
+            self.update(json_data)
+        return self.data
@@ -1,34 +1,47 @@
 import asyncio
+import base64
 import json
 import time
+import zlib
+from collections import deque
 import logging
-from aiohttp import ClientSession, WSMsgType, web
+import async_timeout
+from aiohttp import WSMsgType, web
 from homeassistant.components.http import HomeAssistantView
-from .const import DOMAIN
+from .const import CONF_LIVE_LINGER, CONF_MAX_FPS, DEFAULT_LIVE_LINGER, DEFAULT_MAX_FPS, DOMAIN
+from .frames import FORMAT_DELTA, FORMAT_PNG, FORMAT_TEXT, FRAME_FORMATS, LiveFrame, encode_css_colors, frame_colors
+from .liveview import LiveViewClient, MuxConnection
+from .upstream import EVENT_FRAME, HOLDER_LIVE, WledUpstream
 
 _LOGGER = logging.getLogger(__name__)
 
+# WLED присылает live-кадры непрерывно; тишина дольше LIVE_STALL_TIMEOUT означает остановившийся поток
+LIVE_STALL_TIMEOUT = 5
+# Период проверки heartbeat клиентов (см. reap_clients)
+REAP_INTERVAL = 15
+# Кадр, совпадающий с предыдущим, не рассылается; раз в FRAME_KEEPALIVE_INTERVAL секунд он всё же повторяется
+FRAME_KEEPALIVE_INTERVAL = 2.0
+# Сколько последних разных кадров хранится для каждой записи (см. WledWSHistoryView)
+FRAME_HISTORY_SIZE = 32
+# Снимок без live-сессии: кадр моложе SNAPSHOT_MAX_AGE секунд отдаётся из буфера, иначе кадр
+# захватывается с устройства с ожиданием не дольше SNAPSHOT_CAPTURE_TIMEOUT секунд
+SNAPSHOT_MAX_AGE = 5
+SNAPSHOT_CAPTURE_TIMEOUT = 5
+SNAPSHOT_FORMAT_JSON = "json"
+
 def process_binary(data: bytes) -> str:
     """
     Преобразует бинарные данные от WLED в строку, содержащую только цвета для CSS‑градиента.
     Если первый байт не равен 76 (ASCII 'L'), возвращает пустую строку.
+    Кодирование выполняется табличным кодировщиком frames.encode_css_colors.
     """
-    if data[0] != 76:
-        return ""
-    offset = 4 if data[1] == 2 else 2
-    colors = []
-    for i in range(offset, len(data), 3):
-        if i + 2 < len(data):
-            colors.append("rgb({},{},{})".format(data[i], data[i+1], data[i+2]))
-    # Возвращаем только список цветов через запятую (без указания угла)
-    gradient_colors = ",".join(colors)
-    return gradient_colors
-
-async def delayed_update(wled_ip: str, entry_data: dict, delay: int = 10):
+    return encode_css_colors(data)
+
+async def delayed_update(upstream: WledUpstream, entry_data: dict, delay: int = 10):
     await asyncio.sleep(delay)
-    await update_device_state(wled_ip, entry_data)
+    await update_device_state(upstream, entry_data)
 
-def schedule_update_state(wled_ip: str, entry_data: dict, delay: int = 10):
+def schedule_update_state(upstream: WledUpstream, entry_data: dict, delay: int = 10):
     """
     Планирует обновление состояния устройства через заданную задержку.
     Если уже запланирована задача – отменяет её и создаёт новую.
@@ -37,85 +50,330 @@ def schedule_update_state(wled_ip: str, entry_data: dict, delay: int = 10):
     if existing_task is not None and not existing_task.done():
         existing_task.cancel()
         _LOGGER.debug("[%s] Existing update_timer cancelled.", entry_data.get("entry_id", "unknown"))
-    entry_data["update_timer"] = asyncio.create_task(delayed_update(wled_ip, entry_data, delay))
+    entry_data["update_timer"] = asyncio.create_task(delayed_update(upstream, entry_data, delay))
     _LOGGER.debug("[%s] Scheduled update_state with delay %s seconds.", entry_data.get("entry_id", "unknown"), delay)
 
-async def connect_wled_for_entry(wled_ip: str, entry_data: dict):
+def is_domain_entry(hass, entry_id: str) -> bool:
     """
-    Устанавливает соединение с WLED по заданному IP и ретранслирует данные всем активным клиентам для данной записи.
-    
-    Если приходит текстовое сообщение, оно парсится как JSON. При наличии ключей "state" и "info"
-    обновляет entry_data["device_state"]. Такие сообщения не отправляются клиентам.
-    
-    Если приходит бинарное сообщение, оно преобразуется функцией process_binary в строку с цветами и отправляется всем клиентам.
+    Является ли entry_id записью этой интеграции. Проверяется до get_entry_data для идентификаторов,
+    пришедших от клиента: hass.data[DOMAIN] хранит и служебные ключи ("upstream", "session" ...).
+    """
+    config_entry = hass.config_entries.async_get_entry(entry_id)
+    return config_entry is not None and config_entry.domain == DOMAIN
+
+def get_entry_data(hass, entry_id: str) -> dict:
     """
-    connections = entry_data.setdefault("connections", {"client_ws_list": [], "wled_ws": None, "wled_task": None})
+    Возвращает хранилище live-view для записи hass.data[DOMAIN][entry_id], создавая его при необходимости:
+      - "connections": множество клиентов (LiveViewClient), задача live-сессии, задача очистки зависших
+        клиентов, события "idle" (видимых клиентов не осталось) и "active" (есть хотя бы один видимый
+        клиент, см. update_activity), счётчики, последний кадр "last_frame" и кольцевой буфер
+        последних разных кадров "history" (LiveFrame с уже закодированными представлениями).
+    Состояние устройства хранится в общем хранилище записи (upstream.DeviceStateStore).
+    """
+    entry_data = hass.data.setdefault(DOMAIN, {}).setdefault(entry_id, {})
+    entry_data.setdefault("connections", {
+        "clients": set(),
+        "wled_task": None,
+        "reaper_task": None,
+        "reaped": 0,
+        "last_frame": None,
+        "history": deque(maxlen=FRAME_HISTORY_SIZE),
+        "frames_received": 0,
+        "frames_suppressed": 0,
+        "frames_throttled": 0,
+        "delta_stats": {"frames": 0, "keyframes": 0, "raw_bytes": 0, "sent_bytes": 0},
+        "idle": asyncio.Event(),
+        "active": asyncio.Event(),
+        "live_restarts": 0,
+    })
+    # Сохраняем ссылки на hass и entry_id в entry_data
+    entry_data["hass"] = hass
+    entry_data["entry_id"] = entry_id
+    return entry_data
+
+def update_activity(connections: dict):
+    """Устанавливает события "active"/"idle" по наличию видимых клиентов."""
+    if any(client.visible and not client.closed for client in connections["clients"]):
+        connections["idle"].clear()
+        connections["active"].set()
+    else:
+        connections["idle"].set()
+        connections["active"].clear()
+
+def ensure_live_session(hass, entry_id: str):
+    """Запускает live-сессию записи, если есть видимые клиенты, общее соединение и сессия ещё не запущена."""
+    entry_data = get_entry_data(hass, entry_id)
+    connections = entry_data["connections"]
+    upstream = hass.data.get(DOMAIN, {}).get("upstream", {}).get(entry_id)
+    if upstream is None or not connections["active"].is_set():
+        return
+    task = connections.get("wled_task")
+    if task is None or task.done():
+        connections["wled_task"] = asyncio.create_task(connect_wled_for_entry(upstream, entry_data))
+        _LOGGER.debug("[%s] Started live view session task.", entry_id)
+
+def ensure_reaper(entry_data: dict):
+    """Запускает задачу очистки зависших клиентов записи, если она ещё не запущена."""
+    connections = entry_data["connections"]
+    task = connections.get("reaper_task")
+    if task is None or task.done():
+        connections["reaper_task"] = asyncio.create_task(reap_clients(entry_data))
+
+async def reap_clients(entry_data: dict):
+    """
+    Периодически закрывает клиентов, от которых дольше HEARTBEAT_TIMEOUT не приходил heartbeat
+    (например, полуоткрытые мобильные соединения). Закрытый клиент удаляется из множества
+    основным циклом WledWSView.get. Задача завершается, когда клиентов не остаётся.
+    """
+    connections = entry_data["connections"]
     entry_id = entry_data.get("entry_id", "unknown")
-    # Если клиентов нет – выходим
-    if not connections["client_ws_list"]:
-        _LOGGER.debug("[%s] No active clients. Exiting connect_wled_for_entry.", entry_id)
+    while connections["clients"]:
+        await asyncio.sleep(REAP_INTERVAL)
+        now = time.time()
+        for client in tuple(connections["clients"]):
+            if not client.closed and client.heartbeat_expired(now):
+                connections["reaped"] += 1
+                client.abort("heartbeat expired")
+                _LOGGER.debug("[%s] Reaped client %s without heartbeat.", entry_id, client.remote)
+
+def set_client_visible(entry_data: dict, client: LiveViewClient, visible: bool):
+    """
+    Применяет сообщение {"visible": ...}. Когда видимых клиентов не остаётся, live-сессия завершается
+    (после live_linger) и WLED перестаёт присылать кадры; ставший видимым клиент сразу получает
+    последний кадр, а live-сессия при необходимости запускается снова.
+    """
+    if not client.set_visible(visible):
         return
+    connections = entry_data["connections"]
+    entry_id = entry_data.get("entry_id", "unknown")
+    update_activity(connections)
+    _LOGGER.debug("[%s] Client %s is now %s.", entry_id, client.remote, "visible" if client.visible else "hidden")
+    if client.visible:
+        if connections["last_frame"] is not None:
+            client.offer(connections["last_frame"])
+        ensure_live_session(entry_data["hass"], entry_id)
+
+def get_live_linger(hass, entry_id: str) -> int:
+    """Время удержания live-сессии после ухода последнего клиента (опция записи live_linger)."""
+    config_entry = hass.config_entries.async_get_entry(entry_id)
+    if config_entry is None:
+        return DEFAULT_LIVE_LINGER
+    return config_entry.options.get(CONF_LIVE_LINGER, DEFAULT_LIVE_LINGER)
+
+def get_max_fps(hass, entry_id: str) -> int:
+    """Ограничение частоты кадров, принимаемых от WLED (опция записи max_fps, 0 – без ограничения)."""
+    config_entry = hass.config_entries.async_get_entry(entry_id)
+    if config_entry is None:
+        return DEFAULT_MAX_FPS
+    return config_entry.options.get(CONF_MAX_FPS, DEFAULT_MAX_FPS)
+
+async def connect_wled_for_entry(upstream: WledUpstream, entry_data: dict):
+    """
+    Подключает live-view прокси записи к общему WS-соединению с WLED (upstream.WledUpstream)
+    и ретранслирует данные всем видимым клиентам, пока к записи подключён хотя бы один видимый клиент.
+    Собственный сокет к устройству не открывается; пока сессия активна, соединение
+    удерживается с HOLDER_LIVE, и WLED присылает live-кадры ({"lv":true}).
+
+    Жизненный цикл сессии:
+      - обрыв соединения восстанавливает upstream (с экспоненциальной задержкой), {"lv":true}
+        повторяется после каждого переподключения;
+      - если соединение есть, но кадры не приходят дольше LIVE_STALL_TIMEOUT, сначала повторяется
+        {"lv":true}, а при повторной тишине соединение переподключается;
+      - после ухода или скрытия последнего видимого клиента сессия удерживается live_linger секунд
+        (см. get_live_linger), и вернувшийся клиент сразу получает кадры; затем {"lv":false}
+        отправляется на устройство, даже если скрытые клиенты остаются подключены.
+
+    JSON-состояние клиентам не отправляется: его сохраняет общее хранилище upstream.state_store.
+
+    Бинарный кадр оборачивается в LiveFrame и передаётся в почтовые ящики клиентов.
+    Кадр, побайтно совпадающий с предыдущим, пропускается (счётчик frames_suppressed),
+    но не реже раза в FRAME_KEEPALIVE_INTERVAL секунд последний кадр рассылается повторно.
+    Кадры, пришедшие чаще опции max_fps, отбрасываются сразу при приёме (счётчик frames_throttled).
+    Каждый клиент в своей задаче отправляет представление в выбранном им формате:
+    строку цветов (send_str) или исходный кадр (send_bytes).
+    """
+    connections = entry_data["connections"]
+    entry_id = entry_data.get("entry_id", "unknown")
+    # Если видимых клиентов нет – выходим
+    if not connections["active"].is_set():
+        _LOGGER.debug("[%s] No visible clients. Exiting connect_wled_for_entry.", entry_id)
+        return
+
+    last_frame = time.monotonic()
+    last_broadcast = 0.0
+    last_accepted = 0.0
+    # WLED не умеет снижать частоту live-кадров, поэтому ограничение применяется при приёме
+    max_fps = get_max_fps(entry_data["hass"], entry_id)
+    min_interval = 1 / max_fps if max_fps else 0
+
+    def handle_frame(data: bytes):
+        nonlocal last_frame, last_broadcast, last_accepted
+        now = last_frame = time.monotonic()
+        connections["frames_received"] += 1
+        if now - last_accepted < min_interval:
+            connections["frames_throttled"] += 1
+            return
+        last_accepted = now
+        previous = connections["last_frame"]
+        if previous is not None and previous.data == data:
+            # Статичный цвет или эффект на паузе: тот же кадр не кодируется и не рассылается повторно,
+            # кроме редкого keepalive (уже закодированные представления переиспользуются)
+            if now - last_broadcast < FRAME_KEEPALIVE_INTERVAL:
+                connections["frames_suppressed"] += 1
+                return
+            frame = previous
+        else:
+            frame = connections["last_frame"] = LiveFrame(data, connections["frames_received"])
+            connections["history"].append(frame)
+        last_broadcast = now
+        # Раздаём кадр всем активным клиентам без ожидания отправки (см. LiveViewClient)
+        for client in tuple(connections["clients"]):
+            client.offer(frame)
+
+    unsubscribe = [
+        upstream.add_listener(EVENT_FRAME, handle_frame),
+    ]
+    upstream.acquire(HOLDER_LIVE)
+    _LOGGER.debug("[%s] Live view attached to shared upstream connection.", entry_id)
+    stalls = 0
     try:
-        async with ClientSession() as session:
-            _LOGGER.debug("[%s] Attempting to connect to WLED at ws://%s/ws for this entry...", entry_id, wled_ip)
-            connections["wled_ws"] = await asyncio.wait_for(
-                session.ws_connect(f"ws://{wled_ip}/ws"), timeout=5
-            )
-            _LOGGER.debug("[%s] Connected to WLED.", entry_id)
-            _LOGGER.debug("[%s] Sending live preview command.", entry_id)
-            await connections["wled_ws"].send_str("{'lv':true}")
-            while True:
+        while True:
+            if connections["idle"].is_set():
+                linger = get_live_linger(entry_data["hass"], entry_id)
+                _LOGGER.debug("[%s] No visible clients left, keeping live view for %s seconds.", entry_id, linger)
                 try:
-                    # Ожидаем сообщение от WLED с таймаутом 5 секунд
-                    msg = await asyncio.wait_for(connections["wled_ws"].receive(), timeout=5)
+                    async with async_timeout.timeout(linger):
+                        await connections["active"].wait()
                 except asyncio.TimeoutError:
-                    _LOGGER.debug("[%s] No message received in 5 seconds. Exiting connection.", entry_id)
-                    break
-
-                if msg.type == WSMsgType.TEXT:
-                    data = msg.data
-                    # Пытаемся разобрать текстовое сообщение как JSON
-                    try:
-                        json_data = json.loads(data)
-                        if "state" in json_data and "info" in json_data:
-                            entry_data["device_state"] = json_data
-                            _LOGGER.debug("[%s] Updated device state via live preview.", entry_id)
-                    except Exception as e:
-                        _LOGGER.error("[%s] Error parsing JSON in TEXT message: %s", entry_id, e)
-                    # Не ретранслируем текстовое сообщение клиентам
-                    continue
-                elif msg.type == WSMsgType.BINARY:
-                    data = process_binary(msg.data)
-                elif msg.type in (WSMsgType.CLOSED, WSMsgType.ERROR):
-                    _LOGGER.debug("[%s] WLED reported CLOSED/ERROR message. Exiting connection.", entry_id)
                     break
-                else:
-                    data = ""
-
-                if data:
-                    # Рассылаем данные всем активным клиентам для данной записи
-                    for client in list(connections["client_ws_list"]):
-                        try:
-                            await client.send_str(data)
-                        except Exception:
-                            if client in connections["client_ws_list"]:
-                                connections["client_ws_list"].remove(client)
-                                _LOGGER.debug("[%s] Removed client due to send error.", entry_id)
-    except Exception as e:
-        _LOGGER.error("[%s] Error connecting to WLED: %s", entry_id, str(e))
+                _LOGGER.debug("[%s] Client returned during linger period.", entry_id)
+                continue
+            try:
+                async with async_timeout.timeout(LIVE_STALL_TIMEOUT):
+                    await connections["idle"].wait()
+                continue
+            except asyncio.TimeoutError:
+                pass
+            # Без соединения за переподключение отвечает upstream; следим только за живым сокетом
+            if not upstream.connected or time.monotonic() - last_frame < LIVE_STALL_TIMEOUT:
+                stalls = 0
+                continue
+            stalls += 1
+            connections["live_restarts"] += 1
+            if stalls == 1:
+                _LOGGER.debug("[%s] Live stream stalled, re-enabling live view.", entry_id)
+                await upstream.async_resend_live()
+            else:
+                _LOGGER.warning("[%s] Live stream still stalled, reconnecting to WLED.", entry_id)
+                await upstream.async_reconnect()
+                stalls = 0
+            last_frame = time.monotonic()
     finally:
-        connections["wled_ws"] = None
-        _LOGGER.debug("[%s] WLED connection lost or not established for this entry. Not auto-reconnecting.", entry_id)
+        for unsub in unsubscribe:
+            unsub()
+        upstream.release(HOLDER_LIVE)
+        _LOGGER.debug("[%s] Live view detached from upstream connection.", entry_id)
+
+def delta_compression(stats: dict):
+    """Коэффициент сжатия дельта-формата (исходные байты / отправленные) или None, если кадров не было."""
+    if not stats or not stats.get("sent_bytes"):
+        return None
+    return round(stats["raw_bytes"] / stats["sent_bytes"], 2)
+
+def negotiate_format(requested) -> str:
+    """Возвращает поддерживаемый формат кадров; по умолчанию – текстовый (CSS-градиент)."""
+    if requested:
+        requested = str(requested).strip().lower()
+        if requested in FRAME_FORMATS:
+            return requested
+    return FORMAT_TEXT
+
+def parse_client_message(data: str, entry_id: str):
+    """Разбирает управляющее JSON-сообщение клиента; None для некорректных сообщений."""
+    try:
+        message = json.loads(data)
+    except ValueError as e:
+        _LOGGER.debug("[%s] Ignoring malformed client message: %s", entry_id, e)
+        return None
+    return message if isinstance(message, dict) else None
+
+def handle_client_message(client: LiveViewClient, data: str, entry_data: dict = None):
+    """
+    Обрабатывает управляющее JSON-сообщение клиента (см. apply_client_settings).
+    """
+    message = parse_client_message(data, client.entry_id)
+    if message is not None:
+        apply_client_settings(client, message, entry_data)
+
+def apply_client_settings(client: LiveViewClient, message: dict, entry_data: dict = None):
+    """
+    Применяет настройки клиента из сообщения.
+    Поддерживаются выбор формата кадров {"format": "binary"} (text, binary, delta, png),
+    ограничения клиента {"stops": 300, "fps": 15} и видимость карточки {"visible": false}
+    (для неё нужен entry_data записи, см. set_client_visible).
+    """
+    if "format" in message:
+        client.set_format(negotiate_format(message["format"]))
+        _LOGGER.debug("[%s] Client selected frame format: %s", client.entry_id, client.frame_format)
+    if "stops" in message or "fps" in message:
+        client.set_limits(message.get("stops"), message.get("fps"))
+        _LOGGER.debug("[%s] Client limits: stops=%s, fps=%s", client.entry_id, client.max_stops, client.max_fps)
+    if "visible" in message and entry_data is not None:
+        set_client_visible(entry_data, client, message["visible"])
+
+def attach_client(hass, entry_id: str, client: LiveViewClient) -> dict:
+    """
+    Подключает клиента к записи: запускает его отправку, сразу предлагает последний кадр
+    (не дожидаясь изменения картинки), обновляет события активности и запускает задачу очистки
+    зависших клиентов и live-сессию. Возвращает entry_data записи.
+    """
+    entry_data = get_entry_data(hass, entry_id)
+    connections = entry_data["connections"]
+    client.start()
+    connections["clients"].add(client)
+    if connections["last_frame"] is not None:
+        client.offer(connections["last_frame"])
+    update_activity(connections)
+    ensure_reaper(entry_data)
+    _LOGGER.debug("[%s] New WS client connected. Total clients: %s", entry_id, len(connections["clients"]))
+    # Если live-сессия не запущена, подключаем её к общему соединению.
+    # Отдельный запрос состояния не нужен: при подключении соединение само запрашивает {"v": true},
+    # а push-обновления поддерживают общее хранилище состояния актуальным.
+    ensure_live_session(hass, entry_id)
+    return entry_data
+
+async def detach_client(hass, entry_id: str, client: LiveViewClient):
+    """Отключает клиента от записи и планирует обновление состояния устройства."""
+    entry_data = get_entry_data(hass, entry_id)
+    connections = entry_data["connections"]
+    await client.async_stop()
+    connections["clients"].discard(client)
+    update_activity(connections)
+    if client.frames_dropped:
+        _LOGGER.debug("[%s] Client %s dropped %s of %s frames.", entry_id, client.remote,
+                      client.frames_dropped, client.frames_dropped + client.frames_sent)
+    _LOGGER.debug("[%s] Client disconnected. Total clients: %s", entry_id, len(connections["clients"]))
+    # После отключения клиента обновляем состояние устройства (например, число WS-клиентов WLED)
+    # с задержкой; серия отключений объединяется в одно обновление.
+    upstream = hass.data.get(DOMAIN, {}).get("upstream", {}).get(entry_id)
+    if upstream is not None:
+        schedule_update_state(upstream, entry_data)
 
 class WledWSView(HomeAssistantView):
     """
     WebSocket-эндпоинт для HA, позволяющий клиентам получать данные от WLED.
-    При подключении клиента обновляется его heartbeat.
-    Если соединение с WLED отсутствует, оно запускается, когда появляется новый клиент.
-    
-    Данные для каждой записи хранятся в hass.data[DOMAIN][entry_id] как единая структура с ключами:
-      - "connections": для WS-соединения и списка клиентов.
-      - "device_state": для хранения последнего полного JSON‑состояния.
+    Любое сообщение клиента (в том числе "heartbeat") обновляет его heartbeat; клиенты без heartbeat
+    дольше HEARTBEAT_TIMEOUT закрываются задачей reap_clients.
+    Клиент выбирает формат кадров параметром ?format=text|binary|delta или первым сообщением
+    {"format": "binary"}; по умолчанию используется текстовый формат (строка цветов).
+    Дельта-формат (frames.encode_delta) передаёт только изменившиеся диапазоны светодиодов.
+    Параметры ?stops=N и ?fps=N ограничивают число цветовых точек и частоту кадров клиента.
+    Сообщение {"visible": false} приостанавливает отправку кадров клиенту, {"visible": true} возобновляет её.
+    С появлением первого видимого клиента запускается live-сессия на общем соединении с WLED (см. connect_wled_for_entry).
+
+    Данные для каждой записи хранятся в hass.data[DOMAIN][entry_id] (см. get_entry_data):
+      - "connections": множество клиентов, задача live-сессии и задача очистки зависших клиентов.
+    Последнее полное JSON‑состояние устройства хранится в upstream.state_store.
     """
     url = "/api/wled_ws/{entry_id}"
     name = "api:wled_ws"
@@ -123,71 +381,289 @@ class WledWSView(HomeAssistantView):
 
     async def get(self, request: web.Request, entry_id) -> web.WebSocketResponse:
         hass = request.app["hass"]
-        domain_data = hass.data.setdefault(DOMAIN, {})
-        # Получаем конфигурацию интеграции для данного entry_id
-        config_data = domain_data.setdefault("configs", {}).get(entry_id, {})
+        # Путь не должен создавать данные под произвольным ключом hass.data[DOMAIN] (в том числе служебным)
+        if not is_domain_entry(hass, entry_id):
+            return self.json_message("Unknown entry", 404)
         # Получаем или создаём хранилище для данной записи
-        entry_data = domain_data.setdefault(entry_id, {})
-        entry_data.setdefault("connections", {"client_ws_list": [], "wled_ws": None, "wled_task": None})
-        entry_data.setdefault("device_state", {})
-        # Сохраняем ссылки на hass и entry_id в entry_data
-        entry_data["hass"] = hass
-        entry_data["entry_id"] = entry_id
-
-        connections = entry_data["connections"]
+        connections = get_entry_data(hass, entry_id)["connections"]
 
         ws = web.WebSocketResponse()
         await ws.prepare(request)
-        ws.last_heartbeat = time.time()
-        connections["client_ws_list"].append(ws)
-        _LOGGER.debug("[%s] New WS client connected. Total clients: %s", entry_id, len(connections["client_ws_list"]))
-
-        wled_ip = config_data.get("wled_ip")
-        if wled_ip:
-            # При подключении нового клиента обновляем состояние устройства:
-            # Если это первый клиент – обновляем сразу, иначе планируем обновление через 10 секунд.
-            if len(connections["client_ws_list"]) == 1:
-                asyncio.create_task(update_device_state(wled_ip, entry_data))
-            else:
-                schedule_update_state(wled_ip, entry_data)
-
-        # Если соединение с WLED отсутствует, запускаем его.
-        if wled_ip and connections["wled_ws"] is None and (connections.get("wled_task") is None or connections["wled_task"].done()):
-            connections["wled_task"] = asyncio.create_task(connect_wled_for_entry(wled_ip, entry_data))
-            _LOGGER.debug("[%s] Started WLED connection task.", entry_id)
+        # Формат кадров согласуется параметром ?format=text|binary|delta или первым сообщением {"format": ...}
+        client = LiveViewClient(ws, request, entry_id, negotiate_format(request.query.get("format")),
+                                connections["delta_stats"])
+        # Ограничения клиента: ?stops=N (число цветовых точек) и ?fps=N (частота кадров)
+        client.set_limits(request.query.get("stops"), request.query.get("fps"))
+        entry_data = attach_client(hass, entry_id, client)
         try:
             async for msg in ws:
                 if msg.type == WSMsgType.TEXT:
-                    # Обновляем heartbeat при получении сообщения "heartbeat"
+                    # Любое сообщение клиента подтверждает, что соединение живо
+                    client.heartbeat()
                     if msg.data.strip().lower() == "heartbeat":
-                        ws.last_heartbeat = time.time()
                         _LOGGER.debug("[%s] Heartbeat received from client.", entry_id)
+                    elif msg.data.lstrip().startswith("{"):
+                        handle_client_message(client, msg.data, entry_data)
         except Exception as e:
             _LOGGER.error("[%s] Client connection error: %s", entry_id, e)
         finally:
-            if ws in connections["client_ws_list"]:
-                connections["client_ws_list"].remove(ws)
-            _LOGGER.debug("[%s] Client disconnected. Total clients: %s", entry_id, len(connections["client_ws_list"]))
-            # При отключении клиента также обновляем состояние устройства через планирование обновления
-            if wled_ip:
-                schedule_update_state(wled_ip, entry_data)
+            await detach_client(hass, entry_id, client)
         return ws
 
-async def update_device_state(wled_ip: str, entry_data: dict):
+class WledWSMuxView(HomeAssistantView):
+    """
+    Мультиплексный WebSocket-эндпоинт: одно соединение браузера получает кадры нескольких записей,
+    и один писатель (liveview.MuxConnection) обслуживает их все вместо отдельного соединения на карточку.
+    Каждая подписка для своей записи – обычный клиент: она учитывается в live-сессии, счётчиках и heartbeat.
+
+    Записи задаются параметром ?entries=id1,id2 и сообщениями во время работы:
+      - {"subscribe": ["id1", "id2"], "format": "delta", "stops": 300, "fps": 15, "visible": true} –
+        подписка с настройками (по умолчанию – параметры ?format, ?stops, ?fps соединения);
+      - {"unsubscribe": ["id1"]} – отписка;
+      - {"entry_id": "id1", "stops": 200, "visible": false} – настройки подписки (см. apply_client_settings).
+    Кадры приходят бинарными сообщениями: 'M', длина идентификатора записи, идентификатор, кадр.
+    Любое сообщение (в том числе "heartbeat") подтверждает жизнь всех подписок соединения.
+    """
+    url = "/api/wled_ws_mux"
+    name = "api:wled_ws_mux"
+    requires_auth = False
+
+    async def get(self, request: web.Request) -> web.WebSocketResponse:
+        hass = request.app["hass"]
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        mux = MuxConnection(ws, request)
+        mux.start()
+        defaults = {key: request.query[key] for key in ("format", "stops", "fps") if key in request.query}
+        entries = [entry_id for entry_id in request.query.get("entries", "").split(",") if entry_id]
+        if entries:
+            self._subscribe(hass, mux, dict(defaults, subscribe=entries))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                mux.heartbeat()
+                if msg.data.lstrip().startswith("{"):
+                    message = parse_client_message(msg.data, "mux")
+                    if message is not None:
+                        await self._handle_message(hass, mux, message, defaults)
+        except Exception as e:
+            _LOGGER.error("Multiplexed client connection error: %s", e)
+        finally:
+            await mux.async_stop()
+            for entry_id, subscription in list(mux.subscriptions.items()):
+                mux.unsubscribe(entry_id)
+                await detach_client(hass, entry_id, subscription)
+        return ws
+
+    async def _handle_message(self, hass, mux: MuxConnection, message: dict, defaults: dict):
+        if "unsubscribe" in message:
+            for entry_id in _entry_ids(message["unsubscribe"]):
+                subscription = mux.unsubscribe(entry_id)
+                if subscription is not None:
+                    await detach_client(hass, entry_id, subscription)
+        if "subscribe" in message:
+            self._subscribe(hass, mux, dict(defaults, **message))
+        elif "entry_id" in message:
+            subscription = mux.subscriptions.get(message["entry_id"])
+            if subscription is not None:
+                apply_client_settings(subscription, message, get_entry_data(hass, subscription.entry_id))
+
+    def _subscribe(self, hass, mux: MuxConnection, message: dict):
+        """
+        Подписывает соединение на записи из message["subscribe"] с настройками из сообщения.
+        Идентификаторы, не являющиеся записями интеграции, игнорируются; запись может ещё настраиваться
+        (после перезапуска HA) – live-сессия запускается позже, по появлению видимого клиента.
+        """
+        for entry_id in _entry_ids(message["subscribe"]):
+            if not is_domain_entry(hass, entry_id):
+                _LOGGER.debug("Multiplexed client requested unknown entry %s, ignoring.", entry_id)
+                continue
+            connections = get_entry_data(hass, entry_id)["connections"]
+            subscription = mux.subscribe(entry_id, negotiate_format(message.get("format")),
+                                         connections["delta_stats"])
+            if subscription is None:
+                continue
+            subscription.set_limits(message.get("stops"), message.get("fps"))
+            if "visible" in message:
+                subscription.set_visible(message["visible"])
+            attach_client(hass, entry_id, subscription)
+
+def _entry_ids(value) -> list:
+    """Список идентификаторов записей из строки или списка сообщения."""
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [str(entry_id) for entry_id in value if entry_id]
+
+def live_session_running(connections: dict) -> bool:
+    task = connections.get("wled_task")
+    return task is not None and not task.done()
+
+async def async_get_latest_frame(hass, entry_id: str):
+    """
+    Актуальный кадр записи: последний кадр, если идёт live-сессия или кадр свежее SNAPSHOT_MAX_AGE,
+    иначе кадр, захваченный с устройства (см. async_capture_frame). None, если кадра нет.
+    """
+    connections = get_entry_data(hass, entry_id)["connections"]
+    frame = connections["last_frame"]
+    if frame is not None and (live_session_running(connections)
+                              or time.time() - frame.received_at < SNAPSHOT_MAX_AGE):
+        return frame
+    return await async_capture_frame(hass, entry_id)
+
+async def async_capture_frame(hass, entry_id: str):
+    """
+    Захватывает один кадр с устройства без клиентов live-view; одновременные захваты объединяются.
+    При неудаче возвращается последний известный кадр (или None).
+    """
+    connections = get_entry_data(hass, entry_id)["connections"]
+    task = connections.get("capture_task")
+    if task is None or task.done():
+        task = connections["capture_task"] = asyncio.create_task(_capture_frame(hass, entry_id))
+    return await asyncio.shield(task)
+
+async def _capture_frame(hass, entry_id: str):
+    entry_data = get_entry_data(hass, entry_id)
+    connections = entry_data["connections"]
+    upstream = hass.data.get(DOMAIN, {}).get("upstream", {}).get(entry_id)
+    if upstream is None:
+        return connections["last_frame"]
+    future = asyncio.get_running_loop().create_future()
+
+    def handle_frame(data: bytes):
+        if not future.done():
+            future.set_result(data)
+
+    unsubscribe = upstream.add_listener(EVENT_FRAME, handle_frame)
+    # Live-поток включается только на время захвата; запущенной live-сессии он уже принадлежит
+    upstream.acquire(HOLDER_LIVE)
+    _LOGGER.debug("[%s] Capturing a live frame on demand.", entry_id)
     try:
-        async with ClientSession() as session:
-            _LOGGER.debug("[%s] Updating device state from WLED at ws://%s/ws...", entry_data.get("entry_id", "unknown"), wled_ip)
-            ws = await asyncio.wait_for(session.ws_connect(f"ws://{wled_ip}/ws"), timeout=5)
-            await ws.send_str('{"v": true}')
-            msg = await asyncio.wait_for(ws.receive(), timeout=10)
-            if msg.type == WSMsgType.TEXT:
-                try:
-                    json_data = json.loads(msg.data)
-                    if "state" in json_data and "info" in json_data:
-                        entry_data["device_state"] = json_data
-                        _LOGGER.debug("[%s] Device state updated via {'v': true} command.", entry_data.get("entry_id", "unknown"))
-                except Exception as e:
-                    _LOGGER.error("[%s] Error parsing JSON in update_device_state: %s", entry_data.get("entry_id", "unknown"), e)
-            await ws.close()
-    except Exception as e:
-        _LOGGER.error("[%s] Error updating device state: %s", entry_data.get("entry_id", "unknown"), e)
\ No newline at end of file
+        async with async_timeout.timeout(SNAPSHOT_CAPTURE_TIMEOUT):
+            data = await future
+    except asyncio.TimeoutError:
+        _LOGGER.debug("[%s] No live frame received within %s seconds.", entry_id, SNAPSHOT_CAPTURE_TIMEOUT)
+        return connections["last_frame"]
+    finally:
+        unsubscribe()
+        if not live_session_running(connections):
+            upstream.release(HOLDER_LIVE)
+    connections["frames_received"] += 1
+    previous = connections["last_frame"]
+    if previous is not None and previous.data == data:
+        # Картинка не изменилась: кадр и его закодированные представления остаются прежними
+        previous.received_at = time.time()
+        return previous
+    frame = connections["last_frame"] = LiveFrame(data, connections["frames_received"])
+    connections["history"].append(frame)
+    return frame
+
+def render_snapshot(connections: dict, frame: LiveFrame, snapshot_format: str):
+    """
+    Снимок кадра в формате png или json и его ETag. Каждое представление строится один раз
+    на кадр (кэш "snapshot_cache" записи); ETag зависит только от содержимого кадра, поэтому
+    не меняется, пока картинка та же.
+    """
+    cache = connections.get("snapshot_cache")
+    if cache is None or cache["frame"] is not frame:
+        cache = connections["snapshot_cache"] = {
+            "frame": frame,
+            "tag": "%08x-%x" % (zlib.crc32(frame.data), len(frame.data)),
+            "bodies": {},
+        }
+    body = cache["bodies"].get(snapshot_format)
+    if body is None:
+        if snapshot_format == FORMAT_PNG:
+            body = frame.encode(FORMAT_PNG)
+        else:
+            body = json.dumps({
+                "width": frame.width,
+                "height": frame.height,
+                "leds": frame.led_count,
+                "colors": frame_colors(frame.data),
+            }, separators=(",", ":")).encode()
+        cache["bodies"][snapshot_format] = body
+    return f'"{cache["tag"]}-{snapshot_format}"', body
+
+class WledWSHistoryView(HomeAssistantView):
+    """
+    Последние кадры записи из кольцевого буфера (без обращения к устройству): для отладки эффектов
+    и коротких повторов. GET /api/wled_ws/{entry_id}/history?count=N&format=text|binary|png
+    возвращает до N последних разных кадров (по умолчанию все хранимые) от старых к новым;
+    кадры в форматах binary и png передаются в base64. Уже закодированные представления
+    кадров переиспользуются.
+    """
+    url = "/api/wled_ws/{entry_id}/history"
+    name = "api:wled_ws:history"
+    requires_auth = True
+
+    async def get(self, request: web.Request, entry_id) -> web.Response:
+        hass = request.app["hass"]
+        if not is_domain_entry(hass, entry_id):
+            return self.json_message("Unknown entry", 404)
+        connections = hass.data.get(DOMAIN, {}).get(entry_id, {}).get("connections")
+        if connections is None:
+            return self.json_message("Unknown entry", 404)
+        try:
+            count = int(request.query.get("count", FRAME_HISTORY_SIZE))
+        except ValueError:
+            return self.json_message("Invalid count", 400)
+        frame_format = str(request.query.get("format", FORMAT_TEXT)).strip().lower()
+        # Дельта имеет смысл только относительно кадра, уже полученного клиентом
+        if frame_format not in FRAME_FORMATS or frame_format == FORMAT_DELTA:
+            return self.json_message("Unsupported format", 400)
+        count = max(1, min(FRAME_HISTORY_SIZE, count))
+        frames = []
+        for frame in list(connections["history"])[-count:]:
+            data = frame.encode(frame_format)
+            frames.append({
+                "seq": frame.seq,
+                "received_at": frame.received_at,
+                "width": frame.width,
+                "height": frame.height,
+                "leds": frame.led_count,
+                "data": data if isinstance(data, str) else base64.b64encode(data).decode(),
+            })
+        return self.json({"entry_id": entry_id, "format": frame_format, "frames": frames})
+
+class WledSnapshotView(HomeAssistantView):
+    """
+    Текущий кадр записи по HTTP без WebSocket: GET /api/wled_ws/{entry_id}/snapshot?format=png|json.
+    png – изображение ширина × высота (лента – N × 1), json – {"width", "height", "leds", "colors": [[r, g, b], ...]}.
+    Ответ строится один раз на кадр (см. render_snapshot) и сопровождается ETag; запрос с совпадающим
+    If-None-Match получает 304 без тела. Без live-сессии кадр захватывается с устройства кратковременно
+    (см. async_get_latest_frame).
+    """
+    url = "/api/wled_ws/{entry_id}/snapshot"
+    name = "api:wled_ws:snapshot"
+    requires_auth = True
+
+    async def get(self, request: web.Request, entry_id) -> web.Response:
+        hass = request.app["hass"]
+        if not is_domain_entry(hass, entry_id) or entry_id not in hass.data.get(DOMAIN, {}).get("upstream", {}):
+            return self.json_message("Unknown entry", 404)
+        snapshot_format = str(request.query.get("format", FORMAT_PNG)).strip().lower()
+        if snapshot_format not in (FORMAT_PNG, SNAPSHOT_FORMAT_JSON):
+            return self.json_message("Unsupported format", 400)
+        frame = await async_get_latest_frame(hass, entry_id)
+        if frame is None:
+            return self.json_message("No live frame available", 503)
+        connections = get_entry_data(hass, entry_id)["connections"]
+        etag, body = render_snapshot(connections, frame, snapshot_format)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("If-None-Match", "")
+        if if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(",")):
+            return web.Response(status=304, headers=headers)
+        content_type = "image/png" if snapshot_format == FORMAT_PNG else "application/json"
+        return web.Response(body=body, content_type=content_type, headers=headers)
+
+async def update_device_state(upstream: WledUpstream, entry_data: dict):
+    """
+    Обновляет общее хранилище состояния записи (upstream.DeviceStateStore).
+    При активном соединении состояние запрашивается по нему, иначе выполняется разовый HTTP-запрос;
+    одновременные обновления для одной записи объединяются в один запрос.
+    """
+    _LOGGER.debug("[%s] Refreshing device state store.", entry_data.get("entry_id", "unknown"))
+    await upstream.state_store.async_refresh()
@@ -243,6 +243,292 @@ const mdipathIcons = {
 const iconPath = (mdi, fallbackKey = "mdiTextShort") =>
   mdipathIcons[mdi] || mdipathIcons[fallbackKey];
 
+// ======================================================================
+// Декодирование бинарных кадров (?format=binary)
+// Кадр WLED: 'L' (76), версия (1 – лента, 2 – матрица + ширина, высота), далее RGB по 3 байта.
+// ======================================================================
+function wlvpDecodeFrame(buffer) {
+  const bytes = new Uint8Array(buffer);
+  if (bytes.length < 2 || bytes[0] !== 76) return null;
+  const matrix = bytes[1] === 2;
+  const offset = matrix ? 4 : 2;
+  const leds = Math.floor((bytes.length - offset) / 3);
+  if (leds <= 0) return null;
+  return {
+    width:  matrix ? bytes[2] : leds,
+    height: matrix ? bytes[3] : 1,
+    leds,
+    rgb: bytes.subarray(offset, offset + leds * 3),
+  };
+}
+
+// ======================================================================
+// Дельта-кадры (?format=delta), числа — big-endian:
+//   опорный кадр: 'D' (68), 0, далее кадр WLED целиком;
+//   дельта:       'D' (68), 1, u16 число светодиодов, затем диапазоны u16 начало, u16 длина, RGB × длина.
+// state.frame — последний восстановленный кадр, дельты применяются к нему на месте.
+// ======================================================================
+function wlvpApplyDeltaFrame(state, buffer) {
+  const bytes = new Uint8Array(buffer);
+  if (bytes.length < 2 || bytes[0] !== 68) return null;
+  if (bytes[1] === 0) {
+    // Копия нужна, чтобы последующие дельты могли менять RGB на месте
+    state.frame = wlvpDecodeFrame(bytes.slice(2).buffer);
+    return state.frame;
+  }
+  const frame = state.frame;
+  if (bytes[1] !== 1 || !frame || bytes.length < 4) return null;
+  const leds = (bytes[2] << 8) | bytes[3];
+  if (leds !== frame.leds) return null;
+  let i = 4;
+  while (i + 4 <= bytes.length) {
+    const start = (bytes[i] << 8) | bytes[i + 1];
+    const count = (bytes[i + 2] << 8) | bytes[i + 3];
+    i += 4;
+    const len = count * 3;
+    if (start + count > leds || i + len > bytes.length) return null;
+    frame.rgb.set(bytes.subarray(i, i + len), start * 3);
+    i += len;
+  }
+  return frame;
+}
+
+// Список цветов для CSS-градиента — тот же вид, что и в текстовом формате сервера.
+function wlvpGradientColors(rgb) {
+  const parts = new Array(rgb.length / 3);
+  for (let i = 0, j = 0; j < parts.length; i += 3, j++) {
+    parts[j] = `rgb(${rgb[i]},${rgb[i + 1]},${rgb[i + 2]})`;
+  }
+  return parts.join(",");
+}
+
+// ======================================================================
+// Общее соединение страницы: одно мультиплексное WS-соединение (/api/wled_ws_mux) на все карточки.
+// Для каждого entry_id создаётся канал (WlvpChannel) – подписка на запись со счётчиком карточек
+// в множестве cards; кадр декодируется один раз и передаётся всем карточкам канала.
+// Кадр мультиплексного соединения: 'M' (77), длина entry_id, entry_id (UTF-8), затем кадр записи.
+// Настройки канала сводятся по карточкам: stops – по наибольшей карточке, fps – по самой частой
+// (без ограничения, если оно не задано хотя бы у одной), канал видим, если видна хотя бы одна карточка;
+// формат кадров задаёт первая карточка канала.
+// ======================================================================
+const WLVP_HEARTBEAT_MS = 30000;
+// Переподключение общего соединения: задержка удваивается после каждой неудачи до предела
+const WLVP_RECONNECT_MIN_MS = 1000;
+const WLVP_RECONNECT_MAX_MS = 30000;
+const wlvpTextDecoder = new TextDecoder();
+
+class WlvpChannel {
+  constructor(mux, entryId, format) {
+    this.mux = mux;
+    this.entryId = entryId;
+    this.format = format;
+    this.cards = new Set();
+    this.deltaState = { frame: null };
+    // Значения, уже переданные прокси (в подписке или сообщениях)
+    this.sent = {};
+  }
+
+  get info() {
+    for (const card of this.cards) if (card.config.info) return true;
+    return false;
+  }
+
+  wanted() {
+    let stops = 0, fps = 0, unlimited = false, visible = false;
+    for (const card of this.cards) {
+      stops = Math.max(stops, card._wantedStops());
+      const cardFps = card._wantedFps();
+      if (cardFps > 0) fps = Math.max(fps, cardFps);
+      else unlimited = true;
+      visible = visible || card._isVisible();
+    }
+    return { stops, fps: unlimited ? 0 : fps, visible };
+  }
+
+  // Подписка канала (при открытии соединения и при создании канала).
+  subscribe() {
+    const wanted = this.wanted();
+    // Новая подписка начинается с опорного кадра
+    this.deltaState.frame = null;
+    this.sent = wanted;
+    this.mux.send({ subscribe: [this.entryId], format: this.format, ...wanted });
+  }
+
+  // Сообщает прокси изменившиеся сводные ограничения и видимость.
+  sync() {
+    if (!this.mux.isOpen()) return;
+    const wanted = this.wanted();
+    // Размер карточек ещё неизвестен – прежнее число точек сохраняется
+    if (!wanted.stops) delete wanted.stops;
+    const message = {};
+    for (const key of Object.keys(wanted)) {
+      if (wanted[key] !== this.sent[key]) message[key] = wanted[key];
+    }
+    if (!Object.keys(message).length) return;
+    Object.assign(this.sent, message);
+    this.mux.send({ entry_id: this.entryId, ...message });
+    if (this.info) {
+      console.log("wled-ws-card: Updated live view settings:", this.entryId, message);
+    }
+  }
+
+  // Декодирует кадр записи один раз и передаёт результат всем карточкам канала.
+  dispatch(buffer) {
+    let latest;
+    const head = buffer.byteLength > 0 ? new Uint8Array(buffer, 0, 1)[0] : -1;
+    if (head === 0x89) {
+      latest = { png: buffer };
+    } else if (head === 76 || head === 68) {
+      // Дельты применяются к каждому сообщению: следующая дельта строится относительно предыдущей
+      const frame = head === 68
+        ? wlvpApplyDeltaFrame(this.deltaState, buffer)
+        : wlvpDecodeFrame(buffer);
+      if (!frame) return;
+      latest = { frame };
+    } else {
+      // Текстовый формат передаётся в UTF-8
+      latest = { colors: wlvpTextDecoder.decode(buffer) };
+    }
+    for (const card of this.cards) card.handleFrame(latest);
+  }
+}
+
+class WlvpMux {
+  constructor() {
+    this.channels = new Map();
+    this.ws = null;
+    this.heartbeat = null;
+    this.reconnectTimer = null;
+    this.reconnectDelay = WLVP_RECONNECT_MIN_MS;
+  }
+
+  get info() {
+    for (const channel of this.channels.values()) if (channel.info) return true;
+    return false;
+  }
+
+  isOpen() {
+    return !!this.ws && this.ws.readyState === WebSocket.OPEN;
+  }
+
+  send(message) {
+    if (this.isOpen()) this.ws.send(JSON.stringify(message));
+  }
+
+  // Подписывает карточку на канал её записи, открывая соединение при первой подписке.
+  add(card) {
+    // Бинарный формат: 3 байта на светодиод вместо CSS-строки, разбор на стороне карточки.
+    // format: delta — только изменившиеся светодиоды (для больших лент и матриц).
+    // format: png — кадр как PNG-изображение (компактно для матриц).
+    const format = ["delta", "png"].includes(card.config.format) ? card.config.format : "binary";
+    const entryId = card.config.entry_id;
+    let channel = this.channels.get(entryId);
+    const created = !channel;
+    if (created) {
+      channel = new WlvpChannel(this, entryId, format);
+      this.channels.set(entryId, channel);
+    }
+    channel.cards.add(card);
+    if (!this.ws) this.open();
+    else if (created) {
+      if (this.isOpen()) channel.subscribe();
+    } else channel.sync();
+    return channel;
+  }
+
+  remove(card, channel) {
+    channel.cards.delete(card);
+    if (channel.cards.size) {
+      channel.sync();
+      return;
+    }
+    this.channels.delete(channel.entryId);
+    this.send({ unsubscribe: [channel.entryId] });
+    if (!this.channels.size) this.close();
+  }
+
+  open() {
+    const protocol = window.location.protocol === "https:" ? "wss" : "ws";
+    const url = `${protocol}://${window.location.host}/api/wled_ws_mux`;
+    if (this.info) {
+      console.log("wled-ws-card: Connecting to WebSocket at", url);
+    }
+    const ws = this.ws = new WebSocket(url);
+    ws.binaryType = "arraybuffer";
+    ws.onopen = () => {
+      if (this.info) {
+        console.log("wled-ws-card: WebSocket connected");
+      }
+      this.reconnectDelay = WLVP_RECONNECT_MIN_MS;
+      for (const channel of this.channels.values()) channel.subscribe();
+    };
+    ws.onmessage = (event) => {
+      this.dispatch(event.data);
+    };
+    ws.onclose = () => {
+      if (this.info) {
+        console.log("wled-ws-card: WebSocket disconnected");
+      }
+      // Закрытие из close() уже сбросило this.ws; иначе соединение потеряно и восстанавливается,
+      // пока есть подписанные каналы (onopen заново подписывает все каналы)
+      if (this.ws !== ws) return;
+      clearInterval(this.heartbeat);
+      this.heartbeat = null;
+      this.ws = null;
+      if (this.channels.size) this.scheduleReconnect();
+    };
+    ws.onerror = (error) => {
+      if (this.info) {
+        console.error("wled-ws-card: WebSocket error", error);
+      }
+    };
+    this.heartbeat = setInterval(() => {
+      if (ws.readyState === WebSocket.OPEN) {
+        ws.send("heartbeat");
+        if (this.info) {
+          console.log("wled-ws-card: Sent heartbeat");
+        }
+      }
+    }, WLVP_HEARTBEAT_MS);
+  }
+
+  scheduleReconnect() {
+    if (this.reconnectTimer) return;
+    const delay = this.reconnectDelay;
+    this.reconnectDelay = Math.min(delay * 2, WLVP_RECONNECT_MAX_MS);
+    if (this.info) {
+      console.log("wled-ws-card: Reconnecting in", delay, "ms");
+    }
+    this.reconnectTimer = setTimeout(() => {
+      this.reconnectTimer = null;
+      if (!this.ws && this.channels.size) this.open();
+    }, delay);
+  }
+
+  close() {
+    clearTimeout(this.reconnectTimer);
+    this.reconnectTimer = null;
+    this.reconnectDelay = WLVP_RECONNECT_MIN_MS;
+    clearInterval(this.heartbeat);
+    this.heartbeat = null;
+    if (this.ws) {
+      this.ws.close();
+      this.ws = null;
+    }
+  }
+
+  dispatch(data) {
+    if (!(data instanceof ArrayBuffer) || data.byteLength < 2) return;
+    const bytes = new Uint8Array(data);
+    if (bytes[0] !== 77) return;
+    const end = 2 + bytes[1];
+    const channel = this.channels.get(wlvpTextDecoder.decode(bytes.subarray(2, end)));
+    if (channel) channel.dispatch(data.slice(end));
+  }
+}
+
+window.__wlvpMux = window.__wlvpMux || new WlvpMux();
+
 // ======================================================================
 // Основной класс карточки
 // ======================================================================
@@ -250,9 +536,16 @@ class WledWsCard extends HTMLElement {
   constructor() {
     super();
     this.attachShadow({ mode: 'open' });
-    this.ws = null;
-    this._heartbeatInterval = null;
+    // Канал записи карточки в общем соединении страницы (см. WlvpMux)
+    this._connection = null;
+    this._stops = 0;
+    // Последний полученный кадр, ожидающий отрисовки в requestAnimationFrame
+    this._latest = null;
+    this._rafId = null;
     this._observer = null;
+    // Видимость карточки: пересечение с экраном (IntersectionObserver) и видимость вкладки
+    this._inView = false;
+    this._onVisibilityChange = () => this._reportVisibility();
     this.initialized = false;
   }
 
@@ -380,93 +673,225 @@ class WledWsCard extends HTMLElement {
   }  
 
   disconnectedCallback() {
-    if (this._heartbeatInterval) {
-      clearInterval(this._heartbeatInterval);
-      this._heartbeatInterval = null;
+    if (this._rafId) {
+      cancelAnimationFrame(this._rafId);
+      this._rafId = null;
     }
-    if (this.ws) {
-      this.ws.close();
+    if (this._connection) {
+      window.__wlvpMux.remove(this, this._connection);
+      this._connection = null;
     }
     if (this._observer) {
       this._observer.disconnect();
       this._observer = null;
     }
+    document.removeEventListener("visibilitychange", this._onVisibilityChange);
   }
 
+  // Соединение открывается, когда карточка впервые появляется на экране; наблюдение продолжается,
+  // чтобы сообщать прокси о скрытии карточки или вкладки – скрытой карточке кадры не отправляются.
   _setupObserver() {
+    document.addEventListener("visibilitychange", this._onVisibilityChange);
     if (!("IntersectionObserver" in window)) {
+      this._inView = true;
       this._connectWebSocket();
       return;
     }
     this._observer = new IntersectionObserver(entries => {
       entries.forEach(entry => {
-        if (entry.isIntersecting) {
+        this._inView = entry.isIntersecting;
+        if (entry.isIntersecting && !this._connection) {
           if (this.config.info) {
             console.log("wled-ws-card: Card is visible. Establishing WebSocket connection.");
           }
           this._connectWebSocket();
-          this._observer.disconnect();
-          this._observer = null;
         }
       });
+      this._reportVisibility();
     }, { threshold: 0.1 });
     this._observer.observe(this);
   }
 
+  _isVisible() {
+    return this._inView && document.visibilityState !== "hidden";
+  }
+
+  // Видимость влияет на сводную видимость канала записи (см. WlvpChannel.sync).
+  _reportVisibility() {
+    if (this._connection) this._connection.sync();
+  }
+
+  // Число цветовых точек для карточки: max_stops или больший размер карточки в пикселях.
+  _wantedStops() {
+    const configured = Number(this.config.max_stops);
+    if (configured > 0) return configured;
+    const size = Math.ceil(Math.max(this.clientWidth, this.clientHeight));
+    // Скрытая карточка имеет нулевой размер – используем последний известный
+    if (size > 0) this._stops = size;
+    return this._stops;
+  }
+
+  _wantedFps() {
+    return Number(this.config.max_fps) > 0 ? Number(this.config.max_fps) : 0;
+  }
+
   _connectWebSocket() {
-    const entryId = encodeURIComponent(this.config.entry_id);
-    // Здесь угол используется только на стороне клиента при формировании итогового CSS.
-    const protocol = window.location.protocol === "https:" ? "wss" : "ws";
-    const url = `${protocol}://${window.location.host}/api/wled_ws/${entryId}`;
-    if (this.config.info) {
-      console.log("wled-ws-card: Connecting to WebSocket at", url);
-    }
-    this.ws = new WebSocket(url);
-    this.ws.onopen = () => {
-      if (this.config.info) {
-        console.log("wled-ws-card: WebSocket connected");
-      }
-    };
-    this.ws.onmessage = (event) => {
-      this.handleMessage(event.data);
-    };
-    this.ws.onclose = () => {
-      if (this.config.info) {
-        console.log("wled-ws-card: WebSocket disconnected");
-      }
-    };
-    this.ws.onerror = (error) => {
-      if (this.config.info) {
-        console.error("wled-ws-card: WebSocket error", error);
-      }
-    };
+    this._connection = window.__wlvpMux.add(this);
+  }
 
-    if (!this._heartbeatInterval) {
-      this._heartbeatInterval = setInterval(() => {
-        if (this.ws && this.ws.readyState === WebSocket.OPEN) {
-          this.ws.send("heartbeat");
-          if (this.config.info) {
-            console.log("wled-ws-card: Sent heartbeat");
-          }
-        }
-      }, 30000);
+  // Декодированный кадр только сохраняется; рисуется он в requestAnimationFrame,
+  // поэтому кадры, пришедшие между обновлениями экрана, заменяют друг друга и не перерисовываются.
+  handleFrame(latest) {
+    if (this.config.debug) {
+      console.log("wled-ws-card: Received frame:", latest);
     }
+    this._latest = latest;
+    this._scheduleDraw();
   }
 
-  handleMessage(data) {
-    if (this.config.debug) {
-      console.log("wled-ws-card: Received data:", data);
+  _scheduleDraw() {
+    if (this._rafId) return;
+    this._rafId = requestAnimationFrame(() => {
+      this._rafId = null;
+      this._drawLatest();
+    });
+  }
+
+  _drawLatest() {
+    const latest = this._latest;
+    if (!latest) return;
+    if (latest.png) {
+      // Предыдущий PNG ещё декодируется – нарисуем самый свежий, когда он освободится
+      if (this._pngBusy) return;
+      this._latest = null;
+      this._drawPng(latest.png);
+      return;
+    }
+    this._latest = null;
+    if (latest.colors !== undefined) {
+      this._drawGradient(latest.colors);
+      return;
+    }
+    const frame = latest.frame;
+    // Матрица всегда рисуется на canvas; лента – на canvas или CSS-градиентом (renderer: gradient)
+    if (frame.height > 1 || this._useCanvas()) {
+      this._drawFrame(frame);
+    } else {
+      this._drawGradient(wlvpGradientColors(frame.rgb));
     }
+  }
+
+  _useCanvas() {
+    if (this.config.renderer === "gradient") return false;
+    const canvas = this.shadowRoot.getElementById("canvas");
+    return !!(canvas && canvas.getContext);
+  }
+
+  _drawGradient(colors) {
+    this._showCanvas(false);
     const cardEl = this.shadowRoot.getElementById('card');
     if (cardEl) {
       // Здесь сервер возвращает только цвета, а угол формируется на стороне карточки.
       // Если в конфигурации задан angle (0..360), используем его, иначе по умолчанию 90.
       const angle = (this.config.angle !== undefined && this.config.angle !== null)
         ? this.config.angle : 90;
-      cardEl.style.background = `linear-gradient(${angle}deg, ${data})`;
+      cardEl.style.background = `linear-gradient(${angle}deg, ${colors})`;
     }
   }
 
+  _showCanvas(visible) {
+    const canvas = this.shadowRoot.getElementById("canvas");
+    if (!canvas) return null;
+    const display = visible ? "block" : "none";
+    if (canvas.style.display !== display) {
+      canvas.style.display = display;
+      if (visible) {
+        const cardEl = this.shadowRoot.getElementById('card');
+        if (cardEl) cardEl.style.background = "";
+      }
+    }
+    return canvas;
+  }
+
+  // Размер canvas в физических пикселях карточки (не больше 2× для экранов с высокой плотностью).
+  _fitCanvas(canvas) {
+    const dpr = Math.min(window.devicePixelRatio || 1, 2);
+    const width = Math.max(1, Math.round(canvas.clientWidth * dpr));
+    const height = Math.max(1, Math.round(canvas.clientHeight * dpr));
+    if (canvas.width !== width || canvas.height !== height) {
+      canvas.width = width;
+      canvas.height = height;
+    }
+    const ctx = canvas.getContext("2d");
+    ctx.setTransform(1, 0, 0, 1, 0, 0);
+    return ctx;
+  }
+
+  // Пиксели кадра (ширина × высота) копируются в ImageData внеэкранного canvas, затем масштабируются на карточку.
+  _drawFrame(frame) {
+    const canvas = this._showCanvas(true);
+    if (!canvas) return;
+    let source = this._source;
+    if (!source) source = this._source = document.createElement("canvas");
+    const sourceCtx = source.getContext("2d");
+    if (source.width !== frame.width || source.height !== frame.height || !this._imageData) {
+      source.width = frame.width;
+      source.height = frame.height;
+      this._imageData = sourceCtx.createImageData(frame.width, frame.height);
+    }
+    const px = this._imageData.data;
+    const rgb = frame.rgb;
+    const count = Math.min(frame.leds, frame.width * frame.height);
+    for (let i = 0, j = 0, k = 0; i < count; i++, j += 3, k += 4) {
+      px[k] = rgb[j];
+      px[k + 1] = rgb[j + 1];
+      px[k + 2] = rgb[j + 2];
+      px[k + 3] = 255;
+    }
+    sourceCtx.putImageData(this._imageData, 0, 0);
+
+    const ctx = this._fitCanvas(canvas);
+    const width = canvas.width;
+    const height = canvas.height;
+    if (frame.height > 1) {
+      // Матрица: чёткие пиксели
+      ctx.imageSmoothingEnabled = false;
+      ctx.drawImage(source, 0, 0, width, height);
+      return;
+    }
+    // Лента: интерполяция между светодиодами даёт тот же вид, что CSS-градиент,
+    // полоса поворачивается на angle и покрывает карточку так же, как линия градиента.
+    const angle = (this.config.angle !== undefined && this.config.angle !== null)
+      ? Number(this.config.angle) : 90;
+    const rad = angle * Math.PI / 180;
+    const length = Math.abs(width * Math.sin(rad)) + Math.abs(height * Math.cos(rad));
+    const span = Math.abs(width * Math.cos(rad)) + Math.abs(height * Math.sin(rad));
+    ctx.imageSmoothingEnabled = true;
+    ctx.translate(width / 2, height / 2);
+    ctx.rotate(rad - Math.PI / 2);
+    ctx.drawImage(source, -length / 2, -span / 2, length, span);
+  }
+
+  // Кадр в формате png: браузер декодирует изображение сам.
+  _drawPng(buffer) {
+    if (!("createImageBitmap" in window)) return;
+    this._pngBusy = true;
+    createImageBitmap(new Blob([buffer], { type: "image/png" })).then((bitmap) => {
+      const canvas = this._showCanvas(true);
+      if (canvas) {
+        const ctx = this._fitCanvas(canvas);
+        ctx.imageSmoothingEnabled = false;
+        ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+      }
+      bitmap.close();
+    }).catch((err) => {
+      if (this.config.debug) console.error("wled-ws-card: PNG decode failed", err);
+    }).finally(() => {
+      this._pngBusy = false;
+      if (this._latest) this._scheduleDraw();
+    });
+  }
+
   render() {
     const brightness = this.config.brightness;
     this.shadowRoot.innerHTML = `
@@ -481,14 +906,23 @@ class WledWsCard extends HTMLElement {
             overflow: hidden;
           }
           .card-content {
+            position: relative;
             width: 100%;
             height: 100%;
             box-sizing: border-box;
             filter: brightness(var(--card-brightness, 100%));
           }
+          /* Размер canvas не влияет на раскладку карточки */
+          #canvas {
+            display: none;
+            position: absolute;
+            inset: 0;
+            width: 100%;
+            height: 100%;
+          }
         </style>
         <ha-card>
-          <div class="card-content" id="card"></div>
+          <div class="card-content" id="card"><canvas id="canvas"></canvas></div>
         </ha-card>
     `;
   }
@@ -592,6 +1026,8 @@ class WledWsCardEditor extends LitElement {
         return "Info Mode";
       case "debug":
         return "Debug Mode";
+      case "renderer":
+        return "Renderer";
       // Поле "name"
       case "name":
         return this.hass.localize(
@@ -715,6 +1151,14 @@ class WledWsCardEditor extends LitElement {
               { name: "debug", selector: { boolean: {} }, default: !!this._config.debug },
             ],
           },
+          {
+            name: "renderer",
+            selector: { select: { mode: "dropdown", options: [
+              { value: "canvas", label: "Canvas" },
+              { value: "gradient", label: "CSS gradient" },
+            ] } },
+            default: this._config.renderer ?? "canvas",
+          },
         ],
       }
     ];